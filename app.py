@@ -1,42 +1,143 @@
 # app.py
-import io, os, math, struct
-from fastapi import FastAPI, Request
-from fastapi.responses import Response
-from pydub import AudioSegment
-from openai import OpenAI
+# STT (nube o Whisper local, elegido en cada request: backends.py) + LLM OpenAI + TTS OpenAI
+#   uvicorn app:app --host 0.0.0.0 --port 8000
+#   STT_BACKEND=local uvicorn app:app ...   solo Whisper (lo que antes era app_gtts.py)
+import os, time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
+# antes de importar los módulos del proyecto: cada uno lee su configuración del entorno al importarse
 load_dotenv()
 
-app = FastAPI()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import httpx
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from audio import tone_wav
+from backends import OpenAITts, build_stt_router
+from cache import cache_key, cache_stats, llm_cache, llm_cacheable, normalize_text
+from metrics import RequestTimer, count_bytes, instrumented, record_stage, registry, render as render_metrics
+from pipeline import LLM_MAX_TOKENS, open_reply_stream
+from reply_format import DEFAULT_FORMAT, ReplyFormat, negotiate
+from scheduler import Overloaded, device_id, ptt_scheduler, upload_key
+from stt_batch import stt_batcher
+from vad import NO_SPEECH_REPLY, prepare_speech_pcm, prepare_speech_wav, record as record_vad
+from workers import audio_pool, shutdown_pools
+from ws_session import run_ws_session
+
+# Un solo cliente async con conexiones HTTP reutilizables (keep-alive) para todos los dispositivos
+OPENAI_MAX_CONN = int(os.getenv("OPENAI_MAX_CONN", "32"))
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONN, max_keepalive_connections=OPENAI_MAX_CONN),
+    ),
+)
+tts = OpenAITts(client)
+# Whisper (WHISPER_MODEL, "tiny" o "base" para que vaya más rápido) se carga en segundo plano al arrancar
+stt_router = build_stt_router(client, OPENAI_MAX_CONN)
+registry.collectors.append(stt_router.collect)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    stt_router.start()   # no se espera: mientras Whisper carga, el STT va a la nube
+    yield
+    await stt_router.close()
+    await stt_batcher.close()
+    await client.close()
+    shutdown_pools()
+
+
+app = FastAPI(lifespan=lifespan)
+
+LLM_MODEL = "gpt-4o-mini"
+LLM_TEMPERATURE = 0.3
+SYSTEM_PROMPT = (
+    "Eres un asistente conversacional amable que responde en español "
+    "neutro y termina sus frases en PAPU."
+)
+
+# TTS_STREAM=0 vuelve al modo antiguo (LLM completo, luego TTS completo, luego responde)
+TTS_STREAM = os.getenv("TTS_STREAM", "1") != "0"
+# STT que no entendió nada (Whisper a veces devuelve ""): igual se le pide algo al LLM
+EMPTY_STT_PROMPT = "No entendí nada, responde algo genérico."
+
+def llm_messages(user_text: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_text},
+    ]
+
+def llm_cache_key(user_text: str, max_tokens: int) -> str:
+    return cache_key("llm", LLM_MODEL, SYSTEM_PROMPT, normalize_text(user_text, loose=True),
+                     LLM_TEMPERATURE, max_tokens)
+
+async def transcribe_speech(speech, timer: RequestTimer) -> str:
+    """float32 16 kHz (ya pasado por el VAD) -> el STT más rápido ahora (nube o Whisper), con respaldo."""
+    return await stt_router.transcribe(speech, timer)
+
+async def reply_stream(user_text: str, header: bool = True, timer: RequestTimer = None,
+                       fmt: ReplyFormat = DEFAULT_FORMAT):
+    """
+    LLM por tokens -> TTS por frase. En streaming la respuesta puede ser más larga (LLM_MAX_TOKENS).
+    user_text=None (el VAD no encontró voz): respuesta fija, sin LLM.
+    timer registra "llm" (texto completo) y "tts_first" (primer bloque de audio).
+    fmt: formato de audio negociado con el dispositivo (reply_format.py).
+    """
+    t0 = time.perf_counter()
+    if user_text is None:
+        first, stream = await open_reply_stream(client, tts, LLM_MODEL, [], LLM_TEMPERATURE,
+                                                cached_text=NO_SPEECH_REPLY, header=header, fmt=fmt)
+        record_stage(timer, "tts_first", time.perf_counter() - t0, "canned")
+        return first, stream
+
+    prompt = user_text or EMPTY_STT_PROMPT
+    llm_key = llm_cache_key(prompt, LLM_MAX_TOKENS)
+    cached_text = await llm_cache.get_text(llm_key) if llm_cacheable(LLM_TEMPERATURE) else None
+    llm_backend = "cache" if cached_text is not None else "openai"
+
+    def on_text(text):
+        print(f"[ptt] LLM: {text!r}")
+        record_stage(timer, "llm", time.perf_counter() - t0, llm_backend, LLM_MODEL)
+        if text and cached_text is None and llm_cacheable(LLM_TEMPERATURE):
+            llm_cache.put_text(llm_key, text)
+
+    first, stream = await open_reply_stream(client, tts, LLM_MODEL, llm_messages(prompt), LLM_TEMPERATURE,
+                                            LLM_MAX_TOKENS, cached_text=cached_text, on_text=on_text,
+                                            header=header, fmt=fmt)
+    record_stage(timer, "tts_first", time.perf_counter() - t0, tts.name, tts.model)
+    return first, stream
 
 @app.get("/ping")
 def ping():
     return {"ok": True, "msg": "pong"}
 
+@app.get("/ready")
+def ready():
+    """200 cuando hay al menos un STT listo (la nube lo está al arrancar); estado y EWMA de cada backend."""
+    snap = stt_router.snapshot()
+    return JSONResponse(snap, status_code=200 if snap["ready"] else 503)
+
+@app.get("/cache/stats")
+def cache_stats_route():
+    """Contadores de la caché TTS/LLM (hits, misses, bytes)."""
+    return cache_stats()
+
+@app.get("/sched/stats")
+def sched_stats_route():
+    """Cola de /api/ptt: esperando, corriendo, deduplicados, rechazados (también en /metrics)."""
+    return ptt_scheduler.snapshot()
+
+@app.get("/metrics")
+def metrics_route():
+    """Métricas por etapa, requests en curso y bytes, en formato de texto Prometheus."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/tone")
 def tone():
     """WAV 16 kHz / 16-bit mono de 1 kHz por 1 segundo (para probar salida)."""
-    sr = 16000
-    dur = 1.0
-    N = int(sr * dur)
-    pcm = bytearray()
-    for n in range(N):
-        s = int(30000 * math.sin(2*math.pi*1000*n/sr))
-        pcm += struct.pack("<h", s)
-
-    hdr = bytearray(44)
-    def put32(off, v): hdr[off:off+4] = struct.pack("<I", v)
-    def put16(off, v): hdr[off:off+2] = struct.pack("<H", v)
-
-    dataSize = len(pcm)
-    hdr[0:4] = b"RIFF"; put32(4, 36 + dataSize); hdr[8:12] = b"WAVE"
-    hdr[12:16] = b"fmt "; put32(16, 16); put16(20, 1); put16(22, 1); put32(24, sr)
-    put32(28, sr * 2); put16(32, 2); put16(34, 16)
-    hdr[36:40] = b"data"; put32(40, dataSize)
-
-    return Response(content=bytes(hdr) + bytes(pcm), media_type="audio/wav")
+    return Response(content=tone_wav(1000.0, 1.0), media_type="audio/wav")
 
 @app.post("/api/ptt-echo")
 async def ptt_echo(request: Request):
@@ -45,101 +146,140 @@ async def ptt_echo(request: Request):
     print(f"[ptt-echo] RX {len(data)} bytes")
     return Response(content=data, media_type="audio/wav")
 
+@app.websocket("/ws/ptt")
+async def ws_ptt(ws: WebSocket):
+    """Sesión persistente por dispositivo: sube frames de mic y recibe el PCM de respuesta (ver ws_session.py)."""
+    async def transcribe(pcm: bytes, timer: RequestTimer):
+        t0 = time.perf_counter()
+        speech, vad_stats = await audio_pool.run(prepare_speech_pcm, pcm)
+        timer.since("normalize", t0, "vad")
+        record_vad(vad_stats)
+        print(f"[ws] VAD: {vad_stats}")
+        if speech is None:
+            return None
+        user_text = await transcribe_speech(speech, timer)
+        print(f"[ws] STT: {user_text!r}")
+        return user_text
+
+    await run_ws_session(ws, transcribe, reply_stream)
+
 @app.post("/api/ptt")
+@instrumented("ptt")
 async def ptt(request: Request):
     """
-    1) Recibe WAV 16k/16-bit mono (directo del ESP32)
-    2) STT -> texto (gpt-4o-mini-transcribe, response_format='text')
-    3) LLM -> respuesta corta (gpt-4o-mini, pocos tokens)
-    4) TTS -> audio (gpt-4o-mini-tts) y lo convierto a WAV 16k/16-bit/mono
+    Recibe el WAV y pasa por ptt_scheduler (scheduler.py): un request a la vez por
+    dispositivo, uploads idénticos en curso comparten respuesta, cola llena -> 503 + Retry-After.
+    Formato de la respuesta: ?codec=pcm|ulaw|adpcm&rate=16000|8000 o Accept (ver reply_format.py).
+    Tiempos por etapa en la cabecera Server-Timing y en /metrics.
     """
+    timer = request.state.timer
+    try:
+        fmt = negotiate(request.query_params, request.headers.get("accept"))
+    except ValueError as e:
+        msg = f"Formato de respuesta: {e}"
+        print("[ptt]", msg)
+        return Response(content=msg, status_code=400)
+    # el body se lee aunque después se rechace: si se responde antes, el ESP32 ve la conexión
+    # cortada a mitad del upload en vez del 503
     wav_bytes = await request.body()
+    timer.since("receive", timer.t0)
+    count_bytes("rx", len(wav_bytes))
     print(f"[ptt] RX {len(wav_bytes)} bytes")
 
-    # 1) NO re-procesamos el WAV, lo usamos directo
-    buf_wav = io.BytesIO(wav_bytes)
+    try:
+        return await ptt_scheduler.submit(device_id(request), upload_key(wav_bytes, fmt.name),
+                                          lambda: ptt_pipeline(wav_bytes, fmt, timer), timer)
+    except Overloaded as e:
+        print(f"[ptt] 503 {e}")
+        return e.response()
+
+async def ptt_pipeline(wav_bytes: bytes, fmt: ReplyFormat, timer: RequestTimer):
+    """
+    1) Recibe WAV 16k/16-bit mono (directo del ESP32) y recorta silencios (vad.py)
+    2) STT -> texto: nube (gpt-4o-mini-transcribe) o Whisper local en lotes, según backends.py
+    3) LLM -> respuesta (gpt-4o-mini)
+    4) TTS -> audio (gpt-4o-mini-tts) y lo convierto a WAV 16k/16-bit/mono
+       En streaming (por defecto) 3 y 4 van encadenados: el LLM se corta por frases
+       y cada frase va al TTS apenas termina; el audio sale en orden en un solo WAV.
+    """
+    t0 = time.perf_counter()
 
-    # 2) STT: respuesta en puro texto
+    # 1) VAD: recorta silencios de los bordes y pausas largas, normaliza volumen (en audio_pool)
     try:
-        stt = client.audio.transcriptions.create(
-            model="gpt-4o-mini-transcribe",
-            file=("audio.wav", buf_wav, "audio/wav"),
-            response_format="text",
-            temperature=0.0,
-            language="es"
-        )
-        # según versión del SDK, puede ser str o tener .text
-        if isinstance(stt, str):
-            user_text = stt
-        else:
-            user_text = getattr(stt, "text", "") or str(stt)
-        print(f"[ptt] STT: {user_text!r}")
+        speech, vad_stats = await audio_pool.run(prepare_speech_wav, wav_bytes)
+        timer.since("normalize", t0, "vad")
     except Exception as e:
-        msg = f"Error STT: {e}"
+        msg = f"Error WAV: {e}"
         print("[ptt]", msg)
-        return Response(content=msg, status_code=500)
+        return Response(content=msg, status_code=400)
+    record_vad(vad_stats)
+    print(f"[ptt] VAD: {vad_stats}")
+
+    # 2) STT: respuesta en puro texto (sin voz -> ni STT ni LLM, respuesta fija)
+    user_text = None
+    if speech is not None:
+        try:
+            user_text = await transcribe_speech(speech, timer)
+            print(f"[ptt] STT: {user_text!r}")
+        except Overloaded:
+            raise   # ningún STT listo todavía: 503 (ptt)
+        except Exception as e:
+            msg = f"Error STT: {e}"
+            print("[ptt]", msg)
+            return Response(content=msg, status_code=500)
+
+    # 3+4) streaming: LLM por tokens -> TTS por frase -> WAV 16k/16-bit/mono en orden
+    if TTS_STREAM:
+        try:
+            # espera el primer bloque de audio; si falla aquí todavía podemos responder 500
+            first, stream = await reply_stream(user_text, timer=timer, fmt=fmt)
+        except Exception as e:
+            msg = f"Error LLM/TTS: {e}"
+            print("[ptt]", msg)
+            return Response(content=msg, status_code=500)
+
+        print(f"[ptt] stream: primer bloque {len(first)} bytes")
+        return StreamingResponse(stream, media_type="audio/wav")
+
+    prompt = user_text or EMPTY_STT_PROMPT
+    max_tokens = 30   # clave para que TTS completo sea rápido
+    if user_text is None:
+        llm_key, cached_text = None, NO_SPEECH_REPLY
+    else:
+        llm_key = llm_cache_key(prompt, max_tokens)
+        cached_text = await llm_cache.get_text(llm_key) if llm_cacheable(LLM_TEMPERATURE) else None
 
     # 3) LLM: respuesta corta
+    t0 = time.perf_counter()
     try:
-        resp = client.responses.create(
-            model="gpt-4o-mini",
-            input=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Eres un asistente conversacional amable que responde en español "
-                        "neutro y termina sus frases en PAPU."
-                    ),
-                },
-                {"role": "user", "content": user_text},
-            ],
-            temperature=0.3,
-            max_output_tokens=30,   # clave para que TTS sea rápido
-        )
-
-        ai_text = getattr(resp, "output_text", None) or (
-            resp.get("output_text") if isinstance(resp, dict) else ""
-        )
+        ai_text = cached_text
+        if ai_text is None:
+            resp = await client.responses.create(
+                model=LLM_MODEL,
+                input=llm_messages(prompt),
+                temperature=LLM_TEMPERATURE,
+                max_output_tokens=max_tokens,
+            )
+
+            ai_text = getattr(resp, "output_text", None) or (
+                resp.get("output_text") if isinstance(resp, dict) else ""
+            )
+            if ai_text and llm_cacheable(LLM_TEMPERATURE):
+                llm_cache.put_text(llm_key, ai_text)
         print(f"[ptt] LLM: {ai_text!r}")
+        timer.since("llm", t0, "openai" if cached_text is None else "cache", LLM_MODEL)
     except Exception as e:
         msg = f"Error LLM: {e}"
         print("[ptt]", msg)
         return Response(content=msg, status_code=500)
 
-    # 4) TTS -> bytes + conversión a WAV 16k/16-bit/mono
+    # 4) TTS -> WAV 16k/16-bit/mono
     try:
-        tts = client.audio.speech.create(
-            model="gpt-4o-mini-tts",
-            voice="alloy",
-            input=ai_text,
-        )
-
-        raw = None
-        if isinstance(tts, (bytes, bytearray)):
-            raw = bytes(tts)
-        else:
-            read = getattr(tts, "read", None)
-            if callable(read):
-                raw = read()
-            elif isinstance(tts, dict) and "audio" in tts:
-                raw = tts["audio"]
-            else:
-                try:
-                    raw = bytes(tts)
-                except Exception:
-                    raw = None
-
-        if not raw:
-            raise RuntimeError("No se obtuvieron bytes de TTS")
-
-        # normalizo SOLO el audio de salida
-        src = io.BytesIO(raw)
-        audio_tts = AudioSegment.from_file(src)
-        audio_tts = audio_tts.set_channels(1).set_frame_rate(16000).set_sample_width(2)
-        out_buf = io.BytesIO()
-        audio_tts.export(out_buf, format="wav")
-        out_wav = out_buf.getvalue()
-
+        out_wav = await tts.wav_bytes(ai_text, timer)
+        if not fmt.is_default:
+            t5 = time.perf_counter()
+            out_wav = await audio_pool.run(fmt.encode_wav, out_wav)
+            timer.since("encode", t5, fmt.name)
         print(f"[ptt] TTS -> WAV: {len(out_wav)} bytes")
         return Response(content=out_wav, media_type="audio/wav")
 
@@ -0,0 +1,272 @@
+# audio.py
+# Motor de audio en memoria (NumPy) para el ESP32: WAV 16 kHz / 16-bit / mono.
+#
+# - parse_wav: lee RIFF/WAVE sin copiar (memoryview sobre el body recibido)
+# - mezcla a mono, convierte ancho de muestra y remuestrea con un filtro polifásico vectorizado
+# - si la entrada ya es 16 kHz (lo que manda el ESP32) no se remuestrea: solo pasa a float para el VAD
+#
+# Costo vs pydub (bench/bench_audio.py): pydub remuestrea con audioop.ratecv, interpolación lineal
+# en C, que deja pasar alias. Aquí va un sinc con ventana Kaiser (RESAMPLE_ZEROS cruces por lado):
+# más calidad para el STT, a cambio de un producto punto de K taps por muestra de salida. En la
+# práctica queda parejo o más rápido que pydub, y sin subprocesos ni copias a disco.
+
+import math
+import struct
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SR_OUT = 16000          # lo que reproduce el MAX98357A
+TTS_PCM_SR = 24000      # OpenAI TTS con response_format="pcm": 24 kHz / 16-bit LE / mono
+
+# En un WAV "streaming" no conocemos el largo final: se usa el máximo y el ESP32 lee hasta que se cierre la conexión
+WAV_STREAM_SIZE = 0xFFFFFFFF
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_MULAW = 0x0007
+WAVE_FORMAT_IMA_ADPCM = 0x0011
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# fmt: código WAVE_FORMAT_*; data: memoryview sobre las muestras (sin copiar)
+# block_align: bytes por bloque (un frame en PCM, un bloque comprimido en ADPCM)
+WavInfo = namedtuple("WavInfo", "sample_rate channels bits fmt data block_align")
+
+
+def wav_header(sample_rate: int, data_size: int, channels: int = 1, bits: int = 16) -> bytes:
+    """Cabecera RIFF/WAVE PCM de 44 bytes."""
+    block_align = channels * bits // 8
+    riff_size = min(36 + data_size, 0xFFFFFFFF)
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                                sample_rate * block_align, block_align, bits)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def is_wav(data) -> bool:
+    return len(data) >= 12 and bytes(data[0:4]) == b"RIFF" and bytes(data[8:12]) == b"WAVE"
+
+
+def parse_wav(data) -> WavInfo:
+    """Recorre los chunks RIFF y devuelve el formato + memoryview de las muestras."""
+    mv = memoryview(data).cast("B")
+    if not is_wav(mv):
+        raise ValueError("WAV inválido: falta cabecera RIFF/WAVE")
+
+    fmt = None
+    off = 12
+    while off + 8 <= len(mv):
+        cid = bytes(mv[off:off + 4])
+        size = struct.unpack_from("<I", mv, off + 4)[0]
+        body = off + 8
+        if cid == b"fmt ":
+            if size < 16:
+                raise ValueError("WAV inválido: chunk fmt corto")
+            code, ch, sr, _, align, bits = struct.unpack_from("<HHIIHH", mv, body)
+            if code == WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                code = struct.unpack_from("<H", mv, body + 24)[0]   # SubFormat GUID empieza con el código
+            fmt = (code, ch, sr, bits, align)
+        elif cid == b"data":
+            if fmt is None:
+                raise ValueError("WAV inválido: data antes de fmt")
+            # el ESP32 (o un WAV streaming) puede traer un tamaño que no cuadra: nos quedamos con lo que llegó
+            end = min(body + size, len(mv))
+            code, ch, sr, bits, align = fmt
+            return WavInfo(sr, ch, bits, code, mv[body:end], align)
+        off = body + size + (size & 1)   # los chunks se alinean a 2 bytes
+
+    raise ValueError("WAV inválido: no hay chunk data")
+
+
+def to_float_mono(info: WavInfo) -> np.ndarray:
+    """Muestras del WAV como float32 en [-1, 1], mezcladas a mono."""
+    ch = max(1, info.channels)
+    width = info.bits // 8
+    n = len(info.data) // (width * ch) * width * ch
+    raw = info.data[:n]
+
+    if info.fmt == WAVE_FORMAT_IEEE_FLOAT and info.bits in (32, 64):
+        x = np.frombuffer(raw, dtype="<f4" if info.bits == 32 else "<f8").astype(np.float32)
+    elif info.fmt != WAVE_FORMAT_PCM:
+        raise ValueError(f"WAV no soportado: formato 0x{info.fmt:04x}")
+    elif info.bits == 8:
+        x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif info.bits == 16:
+        x = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif info.bits == 24:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        v = np.where(v & 0x800000, v - 0x1000000, v)
+        x = v.astype(np.float32) / 8388608.0
+    elif info.bits == 32:
+        x = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"WAV no soportado: {info.bits} bits")
+
+    if ch > 1:
+        # sumar columna por columna: mean(axis=1) sobre un eje de 2 es ~10x más lento
+        frames = x.reshape(-1, ch)
+        mono = frames[:, 0].copy()
+        for c in range(1, ch):
+            mono += frames[:, c]
+        mono *= 1.0 / ch
+        x = mono
+    return x
+
+
+def float_to_pcm16(x: np.ndarray) -> bytes:
+    return np.clip(np.rint(x * 32768.0), -32768, 32767).astype("<i2").tobytes()
+
+
+# --- Remuestreo polifásico ---
+
+RESAMPLE_ZEROS = 10      # cruces por cero del sinc a cada lado (calidad vs costo)
+RESAMPLE_BETA = 8.0      # ventana Kaiser
+RESAMPLE_BLOCK = 8192    # salidas por fase y bloque (acota memoria temporal)
+
+
+@lru_cache(maxsize=16)
+def _polyphase_filter(up: int, down: int):
+    """Filtro pasa-bajos (sinc con ventana Kaiser) partido en `up` fases de K coeficientes."""
+    fc = 1.0 / max(up, down)
+    half = RESAMPLE_ZEROS * max(up, down)
+    L = 2 * half + 1
+    n = np.arange(L) - half
+    h = fc * np.sinc(fc * n) * np.kaiser(L, RESAMPLE_BETA) * up
+    K = -(-L // up)
+    h = np.concatenate([h, np.zeros(K * up - L)])
+    # fase p, tap k -> h[p + k*up]
+    return h.reshape(K, up).T.astype(np.float32).copy(), half, K
+
+
+class Resampler:
+    """
+    Remuestreo racional up/down por bloques: y[m] = sum_k H[p, k] * x[n0 - k],
+    con t = m*down + retardo, n0 = t // up, p = t % up. Guarda las últimas K-1
+    muestras entre bloques, así el resultado por bloques es idéntico al de una pasada.
+    """
+
+    def __init__(self, sr_in: int, sr_out: int = SR_OUT):
+        g = math.gcd(sr_in, sr_out)
+        self.up, self.down = sr_out // g, sr_in // g
+        H, self.delay, self.K = _polyphase_filter(self.up, self.down)
+        self.H_rev = np.ascontiguousarray(H[:, ::-1])
+        self._buf = np.zeros(self.K - 1, dtype=np.float32)   # historia (ceros antes del inicio)
+        self._x0 = -(self.K - 1)                             # índice global de _buf[0]
+        self._m = 0                                          # próxima salida
+        self._n_in = 0                                       # muestras de entrada recibidas
+
+    def _produce(self, last_n: int) -> np.ndarray:
+        # salidas m con n0(m) <= last_n
+        if last_n < 0:
+            return np.zeros(0, dtype=np.float32)
+        m_end = (last_n * self.up + self.up - 1 - self.delay) // self.down + 1
+        if m_end <= self._m:
+            # nada nuevo (p.ej. un bloque de 0-1 muestras): la historia puede ser más corta que K
+            return np.zeros(0, dtype=np.float32)
+        outs = []
+        # ventana j = x[j .. j+K-1] sin copiar; con los taps invertidos cada salida es un producto punto
+        win = sliding_window_view(self._buf, self.K)
+        while self._m < m_end:
+            m0, m1 = self._m, min(m_end, self._m + RESAMPLE_BLOCK * self.up)
+            y = np.empty(m1 - m0, dtype=np.float32)
+            # up y down son coprimos: las salidas m, m+up, m+2up... comparten fase y sus ventanas
+            # avanzan de a `down` -> una rebanada con paso (sin índices) y un matvec por fase
+            for j in range(min(self.up, m1 - m0)):
+                t = (m0 + j) * self.down + self.delay
+                row = t // self.up - self._x0 - (self.K - 1)
+                n = (m1 - m0 - j + self.up - 1) // self.up
+                rows = win[row: row + self.down * (n - 1) + 1: self.down]
+                if self.down < self.K:
+                    rows = np.ascontiguousarray(rows)   # ventanas solapadas: BLAS no las toma sin copiar
+                y[j::self.up] = rows @ self.H_rev[t % self.up]
+            outs.append(y)
+            self._m = m1
+        # descartamos lo que ya no necesita ninguna salida futura
+        t = self._m * self.down + self.delay
+        keep_from = t // self.up - (self.K - 1)
+        drop = max(0, keep_from - self._x0)
+        if drop:
+            self._buf = self._buf[drop:]
+            self._x0 += drop
+        return np.concatenate(outs) if outs else np.zeros(0, dtype=np.float32)
+
+    def feed(self, x: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return x.astype(np.float32, copy=False)
+        self._buf = np.concatenate([self._buf, x.astype(np.float32, copy=False)])
+        self._n_in += len(x)
+        return self._produce(self._n_in - 1)
+
+    def flush(self) -> np.ndarray:
+        if self.up == self.down:
+            return np.zeros(0, dtype=np.float32)
+        total = -(-self._n_in * self.up // self.down)
+        if self._m >= total:
+            return np.zeros(0, dtype=np.float32)
+        # rellenamos con ceros lo justo para emitir la cola del filtro
+        last_t = (total - 1) * self.down + self.delay
+        pad = max(0, last_t // self.up - (self._x0 + len(self._buf) - 1))
+        self._buf = np.concatenate([self._buf, np.zeros(pad, dtype=np.float32)])
+        y = self._produce(last_t // self.up)
+        return y[: max(0, len(y) - (self._m - total))]
+
+
+def resample(x: np.ndarray, sr_in: int, sr_out: int = SR_OUT) -> np.ndarray:
+    if sr_in == sr_out:
+        return x
+    rs = Resampler(sr_in, sr_out)
+    return np.concatenate([rs.feed(x), rs.flush()])
+
+
+class StreamResampler:
+    """Remuestrea PCM 16-bit mono por bloques de bytes (p.ej. lo que va llegando del TTS)."""
+
+    def __init__(self, sr_in: int, sr_out: int = SR_OUT):
+        self._rs = Resampler(sr_in, sr_out)
+        self._odd = b""      # byte suelto si un bloque corta una muestra
+
+    def feed(self, data: bytes) -> bytes:
+        data = self._odd + bytes(data)
+        cut = len(data) - (len(data) % 2)
+        self._odd = data[cut:]
+        x = np.frombuffer(data, dtype="<i2", count=cut // 2).astype(np.float32) / 32768.0
+        return float_to_pcm16(self._rs.feed(x))
+
+    def flush(self) -> bytes:
+        self._odd = b""
+        return float_to_pcm16(self._rs.flush())
+
+
+# --- Conversión a lo que espera el ESP32 / Whisper ---
+
+def wav_to_float16k(data) -> np.ndarray:
+    """WAV cualquiera -> float32 mono 16 kHz en [-1, 1]."""
+    info = parse_wav(data)
+    return resample(to_float_mono(info), info.sample_rate, SR_OUT)
+
+
+def float_to_wav16k(x: np.ndarray) -> bytes:
+    pcm = float_to_pcm16(x)
+    return wav_header(SR_OUT, len(pcm)) + pcm
+
+
+def pcm16_to_wav16k(raw: bytes, sample_rate: int) -> bytes:
+    """PCM 16-bit mono crudo (p.ej. TTS con response_format="pcm") -> WAV 16k."""
+    if sample_rate == SR_OUT:
+        pcm = bytes(raw[: len(raw) // 2 * 2])
+    else:
+        x = np.frombuffer(raw, dtype="<i2", count=len(raw) // 2).astype(np.float32) / 32768.0
+        pcm = float_to_pcm16(resample(x, sample_rate, SR_OUT))
+    return wav_header(SR_OUT, len(pcm)) + pcm
+
+
+def tone_wav(freq: float = 1000.0, dur: float = 1.0, amp: int = 30000, sr: int = SR_OUT) -> bytes:
+    """Tono senoidal como WAV 16-bit mono."""
+    n = np.arange(int(sr * dur))
+    pcm = (amp * np.sin(2 * np.pi * freq * n / sr)).astype("<i2").tobytes()
+    return wav_header(sr, len(pcm)) + pcm
@@ -0,0 +1,276 @@
+# backends.py
+# Backends de STT/TTS intercambiables y el router que elige el STT en cada request.
+#
+#   STT_BACKEND      auto | cloud | local   (default auto: los dos si Whisper está instalado)
+#   STT_TIMEOUT      segundos antes de abandonar un backend y probar el otro (default 8)
+#   STT_COOLDOWN     segundos que se evita un backend después de un error o timeout (default 10)
+#   STT_PROBE_EVERY  cada cuántos requests uno va al segundo mejor, para que su EWMA
+#                    no quede vieja (default 20; 0 = nunca)
+#
+# Latencia esperada de cada backend = EWMA de lo que tardó * (1 + requests en curso / capacidad);
+# gana el menor. Si falla o pasa STT_TIMEOUT se prueba el siguiente (el último no tiene timeout).
+# Lo abandonado por timeout no se cancela (un lote de Whisper ya en stt_pool sigue ocupándolo):
+# cuenta como "en curso" hasta que de verdad termina.
+#
+# Whisper se carga en segundo plano al arrancar: el initializer de stt_pool carga y calienta un
+# modelo en cada worker (transcribiendo silencio); mientras tanto todo va a la nube. /ready da 200 apenas hay un STT listo.
+# TTS: por ahora solo OpenAI (tts.py), detrás de la misma interfaz.
+
+import abc
+import asyncio
+import functools
+import io
+import os
+import time
+
+import stt_local
+from audio import float_to_wav16k
+from metrics import PREFIX, record_stage
+from scheduler import Overloaded
+from stt_batch import stt_batcher
+from stt_local import WHISPER_MODEL_NAME, available as whisper_available, warm_up_seconds as whisper_warm_up_seconds
+from tts import TTS_MODEL, tts_pcm_stream, tts_wav_bytes
+from workers import audio_pool
+
+STT_BACKEND = os.getenv("STT_BACKEND", "auto").strip().lower()
+STT_MODEL = "gpt-4o-mini-transcribe"
+EWMA_ALPHA = 0.2
+
+
+# --- STT ---
+
+class SttBackend(abc.ABC):
+    """transcribe(speech float32 16 kHz, timer) -> texto. start() lo deja listo (o en error)."""
+    name = ""
+    model = ""
+
+    def __init__(self, prior_s: float, capacity: int):
+        self.state = "loading"        # loading | ready | error
+        self.error = None
+        self.ewma_s = prior_s         # hasta medir algo: una estimación razonable
+        self.samples = 0
+        self.capacity = max(1, capacity)
+        self.in_flight = 0
+        self.down_until = 0.0         # time.monotonic() hasta el que se evita (después de fallar)
+        self.stats = {"ok": 0, "errors": 0, "timeouts": 0}
+
+    async def start(self):
+        self.state = "ready"
+
+    @abc.abstractmethod
+    async def transcribe(self, speech, timer) -> str:
+        ...
+
+    def expected_s(self) -> float:
+        return self.ewma_s * (1 + self.in_flight / self.capacity)
+
+    def observe(self, seconds: float):
+        # las primeras muestras pesan como un promedio simple: la estimación inicial se olvida rápido
+        self.samples += 1
+        self.ewma_s += max(EWMA_ALPHA, 1 / self.samples) * (seconds - self.ewma_s)
+
+    def snapshot(self) -> dict:
+        return {"model": self.model, "state": self.state, "error": self.error,
+                "ewma_ms": round(self.ewma_s * 1000, 1), "expected_ms": round(self.expected_s() * 1000, 1),
+                "in_flight": self.in_flight, "capacity": self.capacity,
+                "cooldown_s": round(max(0.0, self.down_until - time.monotonic()), 1), **self.stats}
+
+
+class CloudStt(SttBackend):
+    """gpt-4o-mini-transcribe: el audio va como WAV en memoria."""
+    name = "openai"
+    model = STT_MODEL
+
+    def __init__(self, client, capacity: int):
+        super().__init__(prior_s=0.6, capacity=capacity)
+        self.client = client
+
+    async def transcribe(self, speech, timer) -> str:
+        t0 = time.perf_counter()
+        wav = await audio_pool.run(float_to_wav16k, speech)
+        record_stage(timer, "convert", time.perf_counter() - t0, "numpy")
+        stt = await self.client.audio.transcriptions.create(
+            model=self.model,
+            file=("audio.wav", io.BytesIO(wav), "audio/wav"),
+            response_format="text",
+            temperature=0.0,
+            language="es",
+        )
+        # según versión del SDK, puede ser str o tener .text
+        if isinstance(stt, str):
+            return stt
+        return getattr(stt, "text", "") or str(stt)
+
+
+class WhisperStt(SttBackend):
+    """Whisper local en lotes (stt_batch -> stt_pool)."""
+    name = "whisper"
+    model = WHISPER_MODEL_NAME
+
+    def __init__(self, batcher=stt_batcher):
+        super().__init__(prior_s=1.0, capacity=batcher.pool.limit)
+        self.batcher = batcher
+
+    async def start(self):
+        if not whisper_available():
+            self.state, self.error = "error", "whisper/torch no instalados"
+            print(f"[stt] {self.name}: {self.error}, solo nube")
+            return
+        pool = self.batcher.pool
+        t0 = time.perf_counter()
+        # arranca todos los workers: cada uno carga y calienta su modelo en el initializer
+        try:
+            warm = await pool.run_each(whisper_warm_up_seconds)
+        except Exception as e:
+            self.state, self.error = "error", stt_local.init_error or f"{type(e).__name__}: {e}"
+            print(f"[stt] {self.name}: error al cargar: {self.error}")
+            return
+        self.state = "ready"
+        self.observe(min(warm))
+        print(f"[stt] {self.name} ({self.model}) listo en {time.perf_counter() - t0:.1f} s, "
+              f"{len(warm)} workers, decode de prueba {min(warm) * 1000:.0f}-{max(warm) * 1000:.0f} ms")
+
+    async def transcribe(self, speech, timer) -> str:
+        return await self.batcher.transcribe(speech, "es")
+
+
+class SttRouter:
+    def __init__(self, backends: list, timeout: float = 8.0, cooldown: float = 10.0, probe_every: int = 20):
+        self.backends = backends
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.probe_every = probe_every
+        self.stats = {"requests": 0, "fallbacks": 0, "probes": 0}
+        self._tasks = []
+        self._ready = None
+
+    def start(self):
+        """Arranca la carga de todos los backends en segundo plano (no espera a ninguno)."""
+        self._ready = asyncio.Event()
+
+        async def load(b):
+            await b.start()
+            if b.state == "ready":
+                self._ready.set()
+
+        self._tasks = [asyncio.create_task(load(b)) for b in self.backends]
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+
+    @property
+    def ready(self) -> bool:
+        return any(b.state == "ready" for b in self.backends)
+
+    def _order(self, probe: bool = False) -> list:
+        """
+        Backends listos, el de menor latencia esperada primero; los que están en cooldown al final.
+        probe: el segundo mejor pasa adelante (para refrescar su EWMA).
+        """
+        now = time.monotonic()
+        ready = [b for b in self.backends if b.state == "ready"]
+        up = sorted((b for b in ready if now >= b.down_until), key=SttBackend.expected_s)
+        down = sorted((b for b in ready if now < b.down_until), key=lambda b: b.down_until)
+        if probe and len(up) > 1:
+            up[0], up[1] = up[1], up[0]
+            self.stats["probes"] += 1
+        return up + down
+
+    @staticmethod
+    def _finished(b: SttBackend, task: asyncio.Task):
+        b.in_flight -= 1
+        if not task.cancelled():
+            task.exception()   # vista: si se abandonó por timeout nadie más la lee
+
+    async def transcribe(self, speech, timer) -> str:
+        """Lanza Overloaded si todavía no hay ningún STT listo (-> 503)."""
+        self.stats["requests"] += 1
+        probe = bool(self.probe_every) and self.stats["requests"] % self.probe_every == 0
+        order = self._order(probe)
+        if not order and any(b.state == "loading" for b in self.backends):
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                pass
+            order = self._order(probe)
+        if not order:
+            raise Overloaded("ningún STT listo (" + ", ".join(f"{b.name}: {b.error or b.state}"
+                                                            for b in self.backends) + ")", 5)
+
+        for i, b in enumerate(order):
+            last = i == len(order) - 1
+            t0 = time.perf_counter()
+            b.in_flight += 1   # lo baja _finished cuando la tarea termina, aunque se haya abandonado
+            task = asyncio.ensure_future(b.transcribe(speech, timer))
+            task.add_done_callback(functools.partial(self._finished, b))
+            try:
+                text = await asyncio.wait_for(asyncio.shield(task), None if last else self.timeout)
+            except asyncio.CancelledError:
+                task.cancel()   # se fue el cliente: ahí sí se cancela
+                raise
+            except Exception as e:
+                seconds = time.perf_counter() - t0
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                b.stats["timeouts" if timed_out else "errors"] += 1
+                b.down_until = time.monotonic() + self.cooldown
+                if timed_out:
+                    b.observe(seconds)
+                timer.since("stt_failed", t0, b.name, b.model)
+                if last:
+                    raise
+                self.stats["fallbacks"] += 1
+                print(f"[stt] {b.name} {'timeout' if timed_out else f'error: {e}'} -> {order[i + 1].name}")
+                continue
+            b.observe(time.perf_counter() - t0)
+            b.stats["ok"] += 1
+            timer.since("stt", t0, b.name, b.model)
+            return text
+
+    def snapshot(self) -> dict:
+        return {"ready": self.ready, **self.stats, "backends": {b.name: b.snapshot() for b in self.backends}}
+
+    def collect(self) -> list:
+        rows = [("counter", f"{PREFIX}_stt_fallbacks_total", {}, self.stats["fallbacks"])]
+        for b in self.backends:
+            labels = {"backend": b.name}
+            rows += [
+                ("gauge", f"{PREFIX}_stt_ready", labels, int(b.state == "ready")),
+                ("gauge", f"{PREFIX}_stt_expected_seconds", labels, b.expected_s()),
+                ("gauge", f"{PREFIX}_stt_in_flight", labels, b.in_flight),
+            ] + [("counter", f"{PREFIX}_stt_{k}_total", labels, b.stats[k]) for k in ("errors", "timeouts")]
+        return rows
+
+
+def build_stt_router(client, cloud_capacity: int) -> SttRouter:
+    """STT_BACKEND=cloud | local | auto (los dos; Whisper solo entra si está instalado y cargó)."""
+    if STT_BACKEND not in ("auto", "cloud", "local"):
+        raise ValueError(f"STT_BACKEND desconocido: {STT_BACKEND!r} (auto, cloud, local)")
+    backends = []
+    if STT_BACKEND in ("auto", "cloud"):
+        backends.append(CloudStt(client, cloud_capacity))
+    if STT_BACKEND in ("auto", "local"):
+        backends.append(WhisperStt())
+    return SttRouter(
+        backends,
+        timeout=float(os.getenv("STT_TIMEOUT", "8")),
+        cooldown=float(os.getenv("STT_COOLDOWN", "10")),
+        probe_every=max(0, int(os.getenv("STT_PROBE_EVERY", "20"))),
+    )
+
+
+# --- TTS ---
+
+class OpenAITts:
+    """wav_bytes(text) -> WAV 16k completo; pcm_stream(text) -> PCM 16k a medida que llega (tts.py)."""
+    name = "openai"
+    model = TTS_MODEL
+
+    def __init__(self, client):
+        self.client = client
+
+    async def wav_bytes(self, text: str, timer=None) -> bytes:
+        return await tts_wav_bytes(self.client, text, timer)
+
+    def pcm_stream(self, text: str):
+        return tts_pcm_stream(self.client, text)
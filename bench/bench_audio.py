@@ -0,0 +1,79 @@
+# bench/bench_audio.py
+# Compara el motor NumPy (audio.py) contra el camino pydub de antes, en lo que corre el servidor:
+# WAV subido -> float32 16 kHz para el VAD (wav_to_float16k) y PCM 24k del TTS -> WAV 16k.
+#
+#   python bench/bench_audio.py [archivo.wav] [repeticiones]
+#   (necesita pydub y ffmpeg, dependencias opcionales solo de este bench; ver readme.md)
+#
+# Casos: WAV del ESP32 (16k/16-bit/mono), el WAV dado (por defecto test.wav) y PCM 24k del TTS.
+# El remuestreo de pydub es lineal (audioop.ratecv); el de audio.py es un sinc polifásico.
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+
+from audio import SR_OUT, TTS_PCM_SR, pcm16_to_wav16k, wav_header, wav_to_float16k
+
+
+def pydub_segment(data: bytes, fmt: str = None, **kwargs):
+    from pydub import AudioSegment
+    seg = AudioSegment.from_file(io.BytesIO(data), format=fmt, **kwargs)
+    return seg.set_channels(1).set_frame_rate(SR_OUT).set_sample_width(2)
+
+
+def pydub_to_float16k(data: bytes) -> np.ndarray:
+    """Lo mismo que wav_to_float16k, con pydub: decodifica, normaliza y saca las muestras."""
+    seg = pydub_segment(data, "wav")
+    return np.array(seg.get_array_of_samples(), dtype=np.float32) / 32768.0
+
+
+def pydub_to_wav16k(data: bytes, fmt: str = None, **kwargs) -> bytes:
+    """El camino original: AudioSegment.from_file(...).set_*(...).export(...)."""
+    out = io.BytesIO()
+    pydub_segment(data, fmt, **kwargs).export(out, format="wav")
+    return out.getvalue()
+
+
+def timeit(fn, reps: int) -> float:
+    fn()   # calentamiento
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1000.0
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "..", "test.wav")
+    reps = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    rng = np.random.default_rng(0)
+    esp32 = (rng.standard_normal(SR_OUT * 5) * 3000).astype("<i2").tobytes()
+    tts_pcm = (rng.standard_normal(TTS_PCM_SR * 5) * 3000).astype("<i2").tobytes()
+    with open(path, "rb") as f:
+        given = f.read()
+
+    esp32_wav = wav_header(SR_OUT, len(esp32)) + esp32
+    cases = [
+        ("ESP32 16k mono 5s", lambda: wav_to_float16k(esp32_wav), lambda: pydub_to_float16k(esp32_wav)),
+        (os.path.basename(path), lambda: wav_to_float16k(given), lambda: pydub_to_float16k(given)),
+        ("TTS pcm 24k 5s", lambda: pcm16_to_wav16k(tts_pcm, TTS_PCM_SR),
+         lambda: pydub_to_wav16k(tts_pcm, "raw", frame_rate=TTS_PCM_SR, channels=1, sample_width=2)),
+    ]
+
+    print(f"{'caso':<24}{'numpy ms':>12}{'pydub ms':>12}{'x':>8}")
+    for name, fast, slow in cases:
+        t_fast = timeit(fast, reps)
+        try:
+            t_slow = timeit(slow, reps)
+            print(f"{name:<24}{t_fast:>12.2f}{t_slow:>12.2f}{t_slow / t_fast:>8.1f}")
+        except Exception as e:   # sin ffmpeg/pydub instalado
+            print(f"{name:<24}{t_fast:>12.2f}{'n/d':>12}   ({e.__class__.__name__})")
+
+
+if __name__ == "__main__":
+    main()
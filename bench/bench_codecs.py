@@ -0,0 +1,105 @@
+# bench/bench_codecs.py
+# Formatos de respuesta (reply_format.py): tamaño, costo de codificar y calidad de ida y vuelta.
+#
+#   python bench/bench_codecs.py [archivo.wav] [repeticiones]
+#
+# Para cada formato: codifica de una vez y en bloques de streaming (tienen que dar lo mismo),
+# decodifica y mide la SNR contra el PCM de referencia a la misma frecuencia. También compara
+# el camino NumPy de IMA-ADPCM contra el bucle en Python. Sale con código 1 si algo no cuadra.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+
+import reply_format as rf
+from audio import SR_OUT, float_to_pcm16, resample, wav_header, wav_to_float16k
+
+# SNR mínima aceptable (dB) por codec: PCM solo pierde en el remuestreo a 8 kHz (entrada ya cuantizada),
+# μ-law ~ 8 bits logarítmicos, ADPCM ~ 4 bits adaptativos
+MIN_SNR_DB = {"pcm": 60.0, "ulaw": 30.0, "adpcm": 20.0}
+STREAM_CHUNK = 2730   # bytes PCM 16k por bloque, lo que sale del TTS por cada lectura de 4096 bytes a 24k
+
+
+def snr_db(ref: np.ndarray, got: np.ndarray) -> float:
+    n = min(len(ref), len(got))
+    ref, got = ref[:n].astype(np.float64), got[:n].astype(np.float64)
+    noise = np.sum((ref - got) ** 2)
+    return float("inf") if noise == 0 else 10 * np.log10(np.sum(ref ** 2) / noise)
+
+
+def timeit(fn, reps: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1000.0
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "..", "test.wav")
+    reps = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with open(path, "rb") as f:
+        x = wav_to_float16k(f.read())
+    pcm = float_to_pcm16(x)
+    wav16k = wav_header(SR_OUT, len(pcm)) + pcm
+    secs = len(x) / SR_OUT
+    print(f"{path}: {secs:.2f} s, PCM 16k = {len(wav16k) / 1024:.1f} KB\n")
+
+    ok = True
+    print(f"{'formato':<12}{'KB':>8}{'razón':>8}{'KB/s':>8}{'ms':>9}{'% t.real':>10}{'SNR dB':>9}  stream=lote")
+    for codec in rf.CODECS:
+        for rate in rf.RATES:
+            fmt = rf.ReplyFormat(codec, rate)
+            whole = fmt.encode_wav(wav16k)
+
+            enc = fmt.encoder()
+            parts = [fmt.header(len(whole) - len(fmt.header(0)))]
+            for off in range(0, len(pcm), STREAM_CHUNK):
+                parts.append(enc.feed(pcm[off:off + STREAM_CHUNK]))
+            parts.append(enc.flush())
+            same = b"".join(parts) == whole
+
+            got, sr = rf.decode_wav(whole)
+            ref = np.frombuffer(float_to_pcm16(resample(x, SR_OUT, rate)), dtype="<i2")
+            snr = snr_db(ref, got)
+            ms = timeit(lambda: fmt.encode_wav(wav16k), reps)
+            good = same and sr == rate and snr >= MIN_SNR_DB[codec]
+            ok &= good
+            print(f"{fmt.name:<12}{len(whole) / 1024:>8.1f}{len(wav16k) / len(whole):>8.2f}"
+                  f"{len(whole) / 1024 / secs:>8.1f}{ms:>9.2f}{ms / 10 / secs:>10.2f}{snr:>9.1f}  "
+                  f"{'ok' if same else 'DISTINTO'}{'' if good else '  <-- FALLA'}")
+
+    # ADPCM: el camino NumPy (muchos bloques) y el de Python (pocos) tienen que dar los mismos bytes
+    n = len(pcm) // 2 // rf.ADPCM_BLOCK_SAMPLES * rf.ADPCM_BLOCK_SAMPLES
+    blocks = np.frombuffer(pcm, dtype="<i2", count=n)
+    nb = n // rf.ADPCM_BLOCK_SAMPLES
+    limit = rf.ADPCM_VECTOR_MIN
+    try:
+        rf.ADPCM_VECTOR_MIN = 1
+        t_np = timeit(lambda: rf.adpcm_encode(blocks), reps)
+        out_np = rf.adpcm_encode(blocks)
+        rf.ADPCM_VECTOR_MIN = 10 ** 9
+        t_py = timeit(lambda: rf.adpcm_encode(blocks), reps)
+        out_py = rf.adpcm_encode(blocks)
+        one = blocks[: rf.ADPCM_BLOCK_SAMPLES]
+        t_py1 = timeit(lambda: rf.adpcm_encode(one), reps * 10)
+        rf.ADPCM_VECTOR_MIN = 1
+        t_np1 = timeit(lambda: rf.adpcm_encode(one), reps * 10)
+    finally:
+        rf.ADPCM_VECTOR_MIN = limit
+    same = out_np == out_py
+    ok &= same
+    print(f"\nIMA-ADPCM {nb} bloques: NumPy {t_np:.1f} ms, Python {t_py:.1f} ms; "
+          f"1 bloque: NumPy {t_np1:.2f} ms, Python {t_py1:.2f} ms; "
+          f"mismos bytes: {'ok' if same else 'NO'}  (ADPCM_VECTOR_MIN={limit})")
+
+    print("\nOK" if ok else "\nFALLA")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# bench/check_firmware_http.py
+# Lee la respuesta de /api/ptt como la lee paputeadoro.ino: socket crudo, sin quitar "chunked".
+#
+#   python bench/check_firmware_http.py                     # HTTP/1.0, como el firmware (useHTTP10)
+#   python bench/check_firmware_http.py --env TTS_STREAM=0  # camino con respuesta completa
+#   python bench/check_firmware_http.py --http 1.1          # lo que vería un firmware sin useHTTP10
+#
+# El firmware lee 44 bytes de getStreamPtr() y exige "RIFF"/"WAVE", 16 bits, y después reproduce
+# todo lo que llegue hasta que se cierra la conexión. httpx (check_first_byte.py) decodifica el
+# chunked por su cuenta, así que no puede ver este problema.
+
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import tempfile
+from urllib.parse import urlsplit
+
+from load_test import ROOT, start_stack, stop_stack, wait_http
+
+
+def raw_post(base: str, path: str, body: bytes, http: str, timeout: float = 60.0) -> tuple:
+    """POST como el firmware (Connection: close) -> (línea de estado, cabeceras en minúscula, body crudo)."""
+    url = urlsplit(base)
+    with socket.create_connection((url.hostname, url.port), timeout=timeout) as s:
+        s.sendall(f"POST {path} HTTP/{http}\r\nHost: {url.netloc}\r\nContent-Type: audio/wav\r\n"
+                  f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        data = bytearray()
+        while chunk := s.recv(65536):
+            data += chunk
+    head, _, raw = bytes(data).partition(b"\r\n\r\n")
+    status, *lines = head.decode("latin-1").split("\r\n")
+    headers = {k.strip().lower(): v.strip() for k, _, v in (ln.partition(":") for ln in lines)}
+    return status, headers, raw
+
+
+def check_reply(status: str, headers: dict, raw: bytes) -> list:
+    """Lo que rechazaría o reproduciría mal el firmware; vacío si está bien."""
+    problems = []
+    if " 200 " not in status + " ":
+        problems.append(f"estado {status!r}")
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        problems.append("Transfer-Encoding: chunked (el firmware reproduciría los tamaños de bloque)")
+    hdr = raw[:44]
+    if len(hdr) != 44 or hdr[0:4] != b"RIFF" or hdr[8:12] != b"WAVE":
+        problems.append(f"no empieza con cabecera WAV: {hdr[:16]!r}")
+    elif struct.unpack_from("<H", hdr, 34)[0] != 16:
+        problems.append("bits != 16")
+    if "content-length" in headers and int(headers["content-length"]) != len(raw):
+        problems.append(f"Content-Length {headers['content-length']} pero llegaron {len(raw)} bytes")
+    return problems
+
+
+async def check(args) -> tuple:
+    with open(args.wav, "rb") as f:
+        wav = f.read()
+    tmp = tempfile.mkdtemp(prefix="teadoro-fw-")
+    procs, base, fake = start_stack(tmp, env_extra=args.env)
+    try:
+        await wait_http(f"{fake}/health")
+        await wait_http(f"{base}/ready", timeout=120.0)
+        return await asyncio.to_thread(raw_post, base, "/api/ptt", wav, args.http)
+    finally:
+        stop_stack(procs)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Respuesta de /api/ptt leída como la lee el ESP32")
+    ap.add_argument("--wav", default=os.path.join(ROOT, "test.wav"))
+    ap.add_argument("--http", default="1.0", choices=("1.0", "1.1"), help="versión del request (firmware: 1.0)")
+    ap.add_argument("--env", action="append", default=[], help="variable extra para el servidor, KEY=VAL")
+    args = ap.parse_args()
+
+    status, headers, raw = asyncio.run(check(args))
+    print(f"{status}  {len(raw)} bytes  transfer-encoding={headers.get('transfer-encoding', '-')}  "
+          f"content-length={headers.get('content-length', '-')}  inicio={raw[:12]!r}")
+    problems = check_reply(status, headers, raw)
+    assert not problems, "; ".join(problems)
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# bench/check_first_byte.py
+# Chequeo de latencia al primer byte de /api/ptt contra el OpenAI falso (bench/fake_openai.py).
+#
+#   python bench/check_first_byte.py
+#   python bench/check_first_byte.py --tts-rtf 1.0 --env STT_BACKEND=cloud
+#
+# El TTS falso entrega el audio en tiempo real (--tts-rtf 1.0 por defecto), así que generar toda
+# la respuesta toma varios segundos. El primer byte de audio tiene que llegar al cliente antes de
+# que el TTS termine: si el servidor esperara la conversión completa, llegaría después.
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from load_test import ROOT, start_stack, stop_stack, wait_http
+
+
+async def check(args) -> dict:
+    with open(args.wav, "rb") as f:
+        wav = f.read()
+
+    tmp = tempfile.mkdtemp(prefix="teadoro-fb-")
+    procs, base, fake = start_stack(tmp, ["--tts-rtf", args.tts_rtf, "--reply-words", args.reply_words,
+                                          "--jitter", 0], args.env)
+    try:
+        await wait_http(f"{fake}/health")
+        await wait_http(f"{base}/ready", timeout=120.0)
+        async with httpx.AsyncClient(timeout=60.0) as c:
+            t0 = time.time()
+            first = None
+            size = 0
+            async with c.stream("POST", f"{base}/api/ptt", content=wav,
+                                headers={"Content-Type": "audio/wav"}) as r:
+                assert r.status_code == 200, f"status {r.status_code}"
+                async for chunk in r.aiter_raw():
+                    if first is None and chunk:
+                        first = time.time()
+                    size += len(chunk)
+            end = time.time()
+            tts_end = (await c.get(f"{fake}/health")).json()["tts_end"]
+    finally:
+        stop_stack(procs)
+
+    return {"first_ms": (first - t0) * 1000, "tts_end_ms": (tts_end - t0) * 1000,
+            "total_ms": (end - t0) * 1000, "bytes": size, "logs": tmp}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Primer byte de /api/ptt antes de que termine el TTS")
+    ap.add_argument("--wav", default=os.path.join(ROOT, "test.wav"))
+    ap.add_argument("--tts-rtf", type=float, default=1.0, help="segundos de generación por segundo de audio")
+    ap.add_argument("--reply-words", type=int, default=30, help="largo de la respuesta del LLM falso")
+    ap.add_argument("--env", action="append", default=[], help="variable extra para el servidor, KEY=VAL")
+    args = ap.parse_args()
+
+    res = asyncio.run(check(args))
+    print(f"primer byte {res['first_ms']:.0f} ms  fin del TTS {res['tts_end_ms']:.0f} ms  "
+          f"total {res['total_ms']:.0f} ms  ({res['bytes']} bytes, logs en {res['logs']})")
+    assert res["tts_end_ms"] > 0, "el TTS falso no recibió ningún request"
+    assert res["first_ms"] < res["tts_end_ms"], "el primer byte llegó después de que terminó el TTS"
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# bench/check_sched.py
+# Chequeo del control de admisión de scheduler.py, sin servidor ni red.
+#
+#   python bench/check_sched.py
+#
+# Ráfaga: N requests entran en el mismo tick con max_active=1, max_queue=1. Deben pasar 2
+# (uno corriendo y uno en cola) y el resto 503 al tiro, y "queued" tiene que verse mientras esperan.
+#
+# Dispositivos: dos requests del mismo id van en fila; sin id (solo IP, p. ej. detrás de un NAT)
+# corren a la vez.
+#
+# Dedup: si se cancela el request original (su cliente se desconectó), los que esperaban el mismo
+# upload no heredan la cancelación: uno vuelve a correr el pipeline y el resto lo comparte.
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.responses import Response
+
+import metrics
+from scheduler import Overloaded, PttScheduler
+
+
+async def burst(n: int = 5) -> tuple:
+    sched = PttScheduler(max_active=1, max_queue=1, queue_timeout=5.0, dedup=False)
+    seen_queued = []
+
+    async def run():
+        await asyncio.sleep(0.05)   # para entonces ya llegó toda la ráfaga
+        seen_queued.append(sched.queued)
+        return Response(content=b"ok")
+
+    async def one(i: int) -> int:
+        timer = metrics.RequestTimer("check")
+        try:
+            code = (await sched.submit(f"esp32-{i}", f"k{i}", run, timer)).status_code
+        except Overloaded as e:
+            code = e.response().status_code
+        timer.finish(code)
+        return code
+
+    codes = await asyncio.gather(*(one(i) for i in range(n)))
+    return codes, seen_queued, sched.snapshot()
+
+
+async def pair(device) -> float:
+    """Segundos que tardan dos requests de 0.2 s con el mismo device (None = sin id)."""
+    sched = PttScheduler(max_active=4, max_queue=4, queue_timeout=5.0, dedup=False)
+
+    async def run():
+        await asyncio.sleep(0.2)
+        return Response(content=b"ok")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(sched.submit(device, f"k{i}", run, metrics.RequestTimer("check")) for i in range(2)))
+    return time.perf_counter() - t0
+
+
+async def dedup_cancel() -> tuple:
+    sched = PttScheduler(max_active=4, max_queue=4, queue_timeout=5.0, dedup=True)
+    runs = []
+
+    async def run():
+        runs.append(time.perf_counter())
+        await asyncio.sleep(0.1)
+        return Response(content=b"ok")
+
+    def one(i: int):
+        return asyncio.create_task(sched.submit(f"esp32-{i}", "mismo", run, metrics.RequestTimer("check")))
+
+    original = one(0)
+    await asyncio.sleep(0.01)
+    waiters = [one(i) for i in (1, 2)]
+    await asyncio.sleep(0.01)
+    original.cancel()
+    codes = [(await w).status_code for w in waiters]
+    return codes, len(runs), sched.snapshot()
+
+
+def main():
+    same, anon = asyncio.run(pair("esp32-0")), asyncio.run(pair(None))
+    print(f"mismo dispositivo {same:.2f} s  sin id {anon:.2f} s")
+    assert same >= 0.4, "dos requests del mismo dispositivo tenían que ir en fila"
+    assert anon < 0.3, "sin id de dispositivo no hay turno propio: tenían que correr a la vez"
+
+    codes, runs, snap = asyncio.run(dedup_cancel())
+    print(f"dedup con el original cancelado: status {codes}  pipelines {runs}  {snap}")
+    assert codes == [200, 200], codes
+    assert runs == 2, "el original y una sola repetición compartida"
+    assert snap["queued"] == 0 and snap["active"] == 0 and snap["devices"] == 0, snap
+
+    codes, seen_queued, snap = asyncio.run(burst())
+    print(f"status {codes}  queued al correr {seen_queued}  {snap}")
+    assert sorted(codes) == [200, 200, 503, 503, 503], codes
+    assert seen_queued[0] == 1, "el segundo request tenía que verse en cola mientras corría el primero"
+    assert snap["rejected"] == 3 and snap["queued"] == 0 and snap["active"] == 0, snap
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# bench/fake_openai.py
+# Servidor falso de OpenAI para pruebas de carga sin red ni costo: transcriptions, responses y speech.
+#
+#   python bench/fake_openai.py --port 9001 --stt-ms 350 --llm-ms 300 --token-ms 20 --tts-ms 250
+#   OPENAI_BASE_URL=http://127.0.0.1:9001/v1 OPENAI_API_KEY=x uvicorn app:app
+#
+# Las latencias imitan la forma de las reales: STT espera un tiempo fijo más un poco por segundo de
+# audio subido, el LLM tarda en el primer token y luego va token a token (streaming SSE o todo junto),
+# y el TTS tarda en el primer byte y después entrega PCM 24 kHz a ritmo de --tts-rtf.
+# --jitter agrega ruido multiplicativo (0.2 = ±20 % aprox.) para que haya cola en los percentiles.
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+TTS_SR = 24000
+WORDS = ("hola", "claro", "papu", "eso", "depende", "del", "día", "pero", "sí", "te", "puedo", "ayudar",
+         "con", "la", "tarea", "mañana", "también", "bien", "gracias", "por", "preguntar", "ahora", "mismo")
+
+cfg = argparse.Namespace(
+    stt_ms=350.0, stt_ms_per_s=40.0, stt_text="hola qué tal, cómo estás",
+    llm_ms=300.0, token_ms=20.0, reply_words=20,
+    tts_ms=250.0, tts_rtf=0.25, tts_chars_per_s=15.0, tts_chunk=4096,
+    jitter=0.2, seed=0,
+)
+app = FastAPI()
+_count = {"stt": 0, "llm": 0, "tts": 0}
+_times = {"tts_end": 0.0}   # time.time() en que terminó el último stream TTS (bench/check_first_byte.py)
+_rng = random.Random(0)
+
+
+def _sleep(ms: float):
+    if cfg.jitter > 0:
+        ms *= _rng.lognormvariate(0.0, cfg.jitter)
+    return asyncio.sleep(max(0.0, ms) / 1000.0)
+
+
+def _reply_words(n: int) -> list:
+    """Texto distinto por request (si no, la caché TTS del servidor se lo come todo)."""
+    rng = random.Random(cfg.seed * 1_000_003 + n)
+    words = [rng.choice(WORDS) for _ in range(cfg.reply_words)] + [f"n{n}"]
+    out = []
+    for i, w in enumerate(words):
+        end = "." if (i + 1) % 8 == 0 or i == len(words) - 1 else ""
+        out.append(w + end)
+    return out
+
+
+@app.get("/health")
+async def health():
+    return {"ok": True, **_count, **_times}
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    body = await request.body()   # multipart con el WAV; ~32 KB por segundo a 16 kHz
+    _count["stt"] += 1
+    await _sleep(cfg.stt_ms + cfg.stt_ms_per_s * len(body) / 32000)
+    return PlainTextResponse(cfg.stt_text)
+
+
+def _response_obj(text: str) -> dict:
+    return {
+        "id": "resp_fake", "object": "response", "created_at": 0, "model": "fake", "status": "completed",
+        "output": [{"type": "message", "id": "msg_fake", "status": "completed", "role": "assistant",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+        "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+    }
+
+
+@app.post("/v1/responses")
+async def responses(request: Request):
+    body = await request.json()
+    _count["llm"] += 1
+    words = _reply_words(_count["llm"])[: max(1, int(body.get("max_output_tokens") or 10 ** 6))]
+
+    if not body.get("stream"):
+        await _sleep(cfg.llm_ms + cfg.token_ms * len(words))
+        return JSONResponse(_response_obj(" ".join(words)))
+
+    async def events():
+        await _sleep(cfg.llm_ms)
+        for i, w in enumerate(words):
+            ev = {"type": "response.output_text.delta", "delta": w if i == 0 else " " + w, "item_id": "msg_fake",
+                  "output_index": 0, "content_index": 0, "sequence_number": i, "logprobs": []}
+            yield f"event: {ev['type']}\ndata: {json.dumps(ev)}\n\n"
+            await _sleep(cfg.token_ms)
+        done = {"type": "response.completed", "sequence_number": len(words),
+                "response": _response_obj(" ".join(words))}
+        yield f"event: response.completed\ndata: {json.dumps(done)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/audio/speech")
+async def speech(request: Request):
+    body = await request.json()
+    _count["tts"] += 1
+    seconds = max(0.3, len(body.get("input", "")) / cfg.tts_chars_per_s)
+    t = np.arange(int(seconds * TTS_SR)) / TTS_SR
+    pcm = (8000 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))).astype("<i2").tobytes()
+    step = cfg.tts_chunk
+    chunk_ms = step / 2 / TTS_SR * 1000 * cfg.tts_rtf
+
+    async def chunks():
+        await _sleep(cfg.tts_ms)
+        for off in range(0, len(pcm), step):
+            yield pcm[off:off + step]
+            await _sleep(chunk_ms)
+        _times["tts_end"] = time.time()
+
+    return StreamingResponse(chunks(), media_type="audio/pcm")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="OpenAI falso para bench/load_test.py")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9001)
+    ap.add_argument("--stt-ms", type=float, default=cfg.stt_ms, help="latencia base del STT")
+    ap.add_argument("--stt-ms-per-s", type=float, default=cfg.stt_ms_per_s, help="extra por segundo de audio")
+    ap.add_argument("--stt-text", default=cfg.stt_text)
+    ap.add_argument("--llm-ms", type=float, default=cfg.llm_ms, help="tiempo al primer token")
+    ap.add_argument("--token-ms", type=float, default=cfg.token_ms, help="tiempo entre tokens")
+    ap.add_argument("--reply-words", type=int, default=cfg.reply_words, help="largo de la respuesta del LLM")
+    ap.add_argument("--tts-ms", type=float, default=cfg.tts_ms, help="tiempo al primer byte de audio")
+    ap.add_argument("--tts-rtf", type=float, default=cfg.tts_rtf, help="segundos de generación por segundo de audio")
+    ap.add_argument("--tts-chars-per-s", type=float, default=cfg.tts_chars_per_s, help="duración del audio según el texto")
+    ap.add_argument("--tts-chunk", type=int, default=cfg.tts_chunk, help="bytes PCM por bloque del stream")
+    ap.add_argument("--jitter", type=float, default=cfg.jitter)
+    ap.add_argument("--seed", type=int, default=cfg.seed)
+    return ap
+
+
+def main():
+    import uvicorn
+    args = build_parser().parse_args()
+    for k, v in vars(args).items():
+        setattr(cfg, k, v)
+    _rng.seed(cfg.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+# bench/load_test.py
+# Prueba de carga de /api/ptt sin red: levanta bench/fake_openai.py, levanta el servidor apuntando
+# a él (OPENAI_BASE_URL) y simula muchos ESP32 subiendo el mismo WAV a la vez.
+#
+#   python bench/load_test.py --clients 16 --requests 10 --label antes
+#   python bench/load_test.py --env STT_BACKEND=local --env TTS_STREAM=0 --stt-ms 600
+#   python bench/load_test.py --url http://127.0.0.1:8000 --pid 1234      # servidor ya corriendo
+#   python bench/load_test.py --compare bench/results/a.json bench/results/b.json
+#   python bench/load_test.py --env STT_BACKEND=local --sweep STT_POOL_WORKERS=1,2,4   # escala con núcleos?
+#
+# Reporta requests/s, percentiles de primer byte y total, percentiles por etapa (cabecera
+# Server-Timing) y CPU/memoria del proceso del servidor. Guarda todo en bench/results/*.json.
+# --sweep levanta el servidor una vez por valor de la variable y compara req/s entre corridas.
+# Cada request abre su conexión y manda "Connection: close", igual que el firmware.
+# Por defecto el servidor corre con CACHE=0 y SCHED_DEDUP=0: todos los clientes suben el mismo WAV,
+# así que si no, desde la segunda vuelta todo sale de caché y cada ola comparte un solo pipeline.
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+RESULTS_DIR = os.path.join(HERE, "results")
+PCTS = (50, 95, 99)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_http(url: str, timeout: float = 60.0):
+    t_end = time.monotonic() + timeout
+    async with httpx.AsyncClient() as c:
+        while time.monotonic() < t_end:
+            try:
+                if (await c.get(url, timeout=1.0)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout:.0f} s")
+
+
+# --- CPU / memoria del servidor ---
+
+class ProcSampler:
+    """Muestrea CPU (% de un núcleo) y RSS del proceso y sus hijos (pools de procesos) cada `every` s."""
+
+    def __init__(self, pid: int, every: float = 0.5):
+        self.pid = pid
+        self.every = every
+        self.cpu = []
+        self.rss_mb = []
+        self._task = None
+        try:
+            import psutil
+            self._proc = psutil.Process(pid)
+        except ImportError:
+            self._proc = None   # sin psutil se lee /proc (solo Linux, sin hijos)
+
+    def _read(self):
+        """(segundos de CPU acumulados, RSS en bytes)"""
+        if self._proc is not None:
+            procs = [self._proc] + self._proc.children(recursive=True)
+            cpu = rss = 0.0
+            for p in procs:
+                try:
+                    t = p.cpu_times()
+                    cpu += t.user + t.system
+                    rss += p.memory_info().rss
+                except Exception:
+                    pass
+            return cpu, rss
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        tick = os.sysconf("SC_CLK_TCK")
+        cpu = (int(fields[11]) + int(fields[12])) / tick
+        rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        return cpu, rss
+
+    async def _run(self):
+        last_cpu, _ = self._read()
+        last_t = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.every)
+            cpu, rss = self._read()
+            now = time.perf_counter()
+            self.cpu.append(100.0 * (cpu - last_cpu) / (now - last_t))
+            self.rss_mb.append(rss / 2 ** 20)
+            last_cpu, last_t = cpu, now
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if not self.cpu:
+            return {}
+        return {"cpu_avg_pct": round(float(np.mean(self.cpu)), 1), "cpu_max_pct": round(float(np.max(self.cpu)), 1),
+                "rss_max_mb": round(float(np.max(self.rss_mb)), 1), "rss_end_mb": round(self.rss_mb[-1], 1)}
+
+
+# --- clientes ---
+
+def parse_server_timing(value: str) -> dict:
+    """
+    "stt;dur=12.3, llm;dur=4" -> {"stt": 12.3, "llm": 4.0}; etapas repetidas se suman.
+    El "total" del servidor (hasta mandar las cabeceras) queda como "server".
+    """
+    out = {}
+    for part in value.split(","):
+        name, _, rest = part.strip().partition(";")
+        name = "server" if name == "total" else name
+        for param in rest.split(";"):
+            k, _, v = param.strip().partition("=")
+            if k == "dur" and name:
+                out[name] = out.get(name, 0.0) + float(v)
+    return out
+
+
+async def one_request(c: httpx.AsyncClient, url: str, wav: bytes, device: str, params: dict = None) -> dict:
+    t0 = time.perf_counter()
+    rec = {"device": device, "status": 0, "bytes": 0}
+    try:
+        async with c.stream("POST", url, content=wav, params={"device": device, **(params or {})},
+                            headers={"Content-Type": "audio/wav", "Connection": "close"}) as r:
+            rec["status"] = r.status_code
+            rec["stages"] = parse_server_timing(r.headers.get("server-timing", ""))
+            async for chunk in r.aiter_raw():
+                if "ttfb_ms" not in rec:
+                    rec["ttfb_ms"] = (time.perf_counter() - t0) * 1000
+                rec["bytes"] += len(chunk)
+    except httpx.HTTPError as e:
+        rec["error"] = f"{type(e).__name__}: {e}"
+    rec["total_ms"] = (time.perf_counter() - t0) * 1000
+    return rec
+
+
+async def client_loop(c, url, wav, idx, n, think_ms, records, params=None):
+    device = f"esp32-{idx:03d}"
+    for _ in range(n):
+        records.append(await one_request(c, url, wav, device, params))
+        if think_ms:
+            await asyncio.sleep(think_ms / 1000)
+
+
+def pct(values) -> dict:
+    if not values:
+        return {}
+    a = np.asarray(values, dtype=float)
+    return {f"p{p}": round(float(np.percentile(a, p)), 1) for p in PCTS} | {"mean": round(float(a.mean()), 1)}
+
+
+def summarize(records: list, wall: float) -> dict:
+    ok = [r for r in records if r["status"] == 200]
+    stages = sorted({k for r in ok for k in r.get("stages", {})})
+    status = {}
+    for r in records:
+        key = str(r["status"]) if r["status"] else "error"
+        status[key] = status.get(key, 0) + 1
+    return {
+        "requests": len(records),
+        "ok": len(ok),
+        "status": status,
+        "wall_s": round(wall, 2),
+        "rps": round(len(ok) / wall, 2) if wall > 0 else 0.0,
+        "ttfb_ms": pct([r["ttfb_ms"] for r in ok if "ttfb_ms" in r]),
+        "total_ms": pct([r["total_ms"] for r in ok]),
+        "reply_kb": round(float(np.mean([r["bytes"] for r in ok])) / 1024, 1) if ok else 0.0,
+        "stages_ms": {s: pct([r["stages"][s] for r in ok if s in r.get("stages", {})]) for s in stages},
+    }
+
+
+def print_summary(res: dict):
+    s, srv = res["summary"], res.get("server", {})
+    print(f"\n== {res['label']}  ({res['config']['clients']} clientes x {res['config']['requests']} requests)")
+    print(f"   ok {s['ok']}/{s['requests']}  status {s['status']}  {s['rps']} req/s  en {s['wall_s']} s  "
+          f"respuesta media {s['reply_kb']} KB")
+    rows = [("primer byte", s["ttfb_ms"]), ("total", s["total_ms"])] + list(s["stages_ms"].items())
+    print(f"   {'ms':<14}" + "".join(f"{k:>10}" for k in ("p50", "p95", "p99", "mean")))
+    for name, p in rows:
+        if p:
+            print(f"   {name:<14}" + "".join(f"{p[k]:>10.1f}" for k in ("p50", "p95", "p99", "mean")))
+    if srv:
+        print(f"   servidor: CPU media {srv['cpu_avg_pct']}% (máx {srv['cpu_max_pct']}%), "
+              f"RSS máx {srv['rss_max_mb']} MB")
+
+
+def compare(path_a: str, path_b: str):
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+
+    def flat(res):
+        s = res["summary"]
+        out = {"req/s": s["rps"]}
+        for name, p in [("primer byte", s["ttfb_ms"]), ("total", s["total_ms"])] + list(s["stages_ms"].items()):
+            for k in ("p50", "p95", "p99"):
+                if k in p:
+                    out[f"{name} {k}"] = p[k]
+        for k, v in res.get("server", {}).items():
+            out[k] = v
+        return out
+
+    fa, fb = flat(a), flat(b)
+    print(f"{'':<22}{a['label']:>14}{b['label']:>14}{'cambio':>10}")
+    for k in list(fa) + [k for k in fb if k not in fa]:
+        va, vb = fa.get(k), fb.get(k)
+        delta = f"{(vb - va) / va * 100:+.1f}%" if va and vb is not None else ""
+        print(f"{k:<22}{'' if va is None else va:>14}{'' if vb is None else vb:>14}{delta:>10}")
+
+
+# --- orquestación ---
+
+def spawn(cmd: list, env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def start_stack(tmp: str, fake_args=(), env_extra=(), app: str = "app") -> tuple:
+    """
+    Levanta bench/fake_openai.py y el servidor apuntando a él (logs en tmp).
+    env_extra: "KEY=VAL" que pisan los defaults (CACHE=0, SCHED_DEDUP=0). -> (procesos, url servidor, url falso)
+    """
+    fake_port, app_port = free_port(), free_port()
+    procs = [spawn([sys.executable, os.path.join(HERE, "fake_openai.py"), "--port", str(fake_port)]
+                   + [str(x) for x in fake_args], dict(os.environ), os.path.join(tmp, "fake.log"))]
+    env = dict(os.environ, OPENAI_API_KEY="bench", OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+               CACHE="0", SCHED_DEDUP="0", CACHE_DIR=os.path.join(tmp, "cache"))
+    for kv in env_extra:
+        k, _, v = kv.partition("=")
+        env[k] = v
+    procs.append(spawn([sys.executable, "-m", "uvicorn", f"{app}:app", "--port", str(app_port),
+                        "--log-level", "warning"], env, os.path.join(tmp, "app.log")))
+    return procs, f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{fake_port}"
+
+
+def stop_stack(procs: list):
+    for p in reversed(procs):
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+async def run(args) -> dict:
+    with open(args.wav, "rb") as f:
+        wav = f.read()
+
+    procs = []
+    tmp = tempfile.mkdtemp(prefix="teadoro-bench-")
+    pid = args.pid
+    try:
+        if args.url:
+            base = args.url.rstrip("/")
+        else:
+            fake_args = ["--stt-ms", args.stt_ms, "--llm-ms", args.llm_ms, "--token-ms", args.token_ms,
+                         "--reply-words", args.reply_words, "--tts-ms", args.tts_ms, "--tts-rtf", args.tts_rtf,
+                         "--jitter", args.jitter]
+            procs, base, fake = start_stack(tmp, fake_args, args.env, args.app)
+            pid = procs[-1].pid
+            await wait_http(f"{fake}/health")
+        await wait_http(f"{base}/ready", timeout=args.startup_timeout)
+
+        params = {"codec": args.codec, "rate": args.rate} if args.codec else None
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=0)
+        async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as c:
+            for _ in range(args.warmup):
+                await one_request(c, f"{base}/api/ptt", wav, "warmup", params)
+
+            sampler = ProcSampler(pid) if pid else None
+            if sampler:
+                sampler.start()
+            records = []
+            t0 = time.perf_counter()
+            await asyncio.gather(*(client_loop(c, f"{base}/api/ptt", wav, i, args.requests, args.think_ms, records,
+                                               params) for i in range(args.clients)))
+            wall = time.perf_counter() - t0
+            server = await sampler.stop() if sampler else {}
+
+        errors = [r["error"] for r in records if "error" in r][:5]
+        if errors:
+            print("[bench] errores (primeros):", *errors, sep="\n  ")
+    finally:
+        stop_stack(procs)
+        if procs and args.keep_logs:
+            print(f"[bench] logs en {tmp}")
+
+    return {
+        "label": args.label,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare",)},
+        "wav_bytes": len(wav),
+        "summary": summarize(records, wall),
+        "server": server,
+        "records": records,
+    }
+
+
+def print_sweep(key: str, results: list):
+    cfg, cpus = results[0][1]["config"], results[0][1]["cpus"]
+    print(f"\n== {key}: {cfg['clients']} clientes x {cfg['requests']} requests, {cpus} núcleos")
+    if key.endswith("_WORKERS") and max(int(v) for v, _ in results) > cpus:
+        print(f"   ojo: más workers que núcleos ({cpus}); esto no mide si escala, correrlo en una máquina multinúcleo")
+    print(f"   {key:<20}{'req/s':>8}{'total p50':>11}{'total p95':>11}{'CPU media %':>13}")
+    for value, res in results:
+        s, srv = res["summary"], res.get("server", {})
+        print(f"   {value:<20}{s['rps']:>8.2f}{s['total_ms'].get('p50', 0):>11.1f}{s['total_ms'].get('p95', 0):>11.1f}"
+              f"{srv.get('cpu_avg_pct', 0):>13.1f}")
+
+
+def save(res: dict, out: str = None) -> str:
+    out = out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{res['label']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(res, f, indent=1)
+    print(f"[bench] resultados en {out}")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Prueba de carga de /api/ptt con un OpenAI falso")
+    ap.add_argument("--app", default="app", help="módulo del servidor (el STT se elige con --env STT_BACKEND=...)")
+    ap.add_argument("--url", default=None, help="usar un servidor ya levantado (no se levanta el OpenAI falso)")
+    ap.add_argument("--pid", type=int, default=None, help="PID del servidor para medir CPU/memoria con --url")
+    ap.add_argument("--env", action="append", default=[], help="variable extra para el servidor, KEY=VAL")
+    ap.add_argument("--wav", default=os.path.join(ROOT, "test.wav"))
+    ap.add_argument("--clients", type=int, default=8, help="ESP32 simulados en paralelo")
+    ap.add_argument("--requests", type=int, default=5, help="requests por cliente")
+    ap.add_argument("--think-ms", type=float, default=0.0, help="pausa entre pulsaciones de un mismo cliente")
+    ap.add_argument("--codec", default=None, help="formato pedido para la respuesta (pcm, ulaw, adpcm)")
+    ap.add_argument("--rate", type=int, default=16000, help="frecuencia pedida con --codec")
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--timeout", type=float, default=60.0, help="igual que el firmware")
+    ap.add_argument("--startup-timeout", type=float, default=120.0)
+    ap.add_argument("--label", default=None)
+    ap.add_argument("--out", default=None, help="archivo de resultados (default bench/results/<fecha>-<label>.json)")
+    ap.add_argument("--keep-logs", action="store_true")
+    ap.add_argument("--sweep", default=None, metavar="KEY=V1,V2",
+                    help="una corrida por valor de la variable del servidor (p. ej. STT_POOL_WORKERS=1,2,4)")
+    ap.add_argument("--compare", nargs=2, metavar=("A", "B"), help="compara dos resultados guardados y sale")
+    # latencias del OpenAI falso (ver bench/fake_openai.py)
+    ap.add_argument("--stt-ms", type=float, default=350.0)
+    ap.add_argument("--llm-ms", type=float, default=300.0)
+    ap.add_argument("--token-ms", type=float, default=20.0)
+    ap.add_argument("--reply-words", type=int, default=20)
+    ap.add_argument("--tts-ms", type=float, default=250.0)
+    ap.add_argument("--tts-rtf", type=float, default=0.25)
+    ap.add_argument("--jitter", type=float, default=0.2)
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    args.label = args.label or f"{args.app}-c{args.clients}"
+    if args.sweep:
+        if args.url:
+            ap.error("--sweep levanta su propio servidor; no se puede usar con --url")
+        key, _, values = args.sweep.partition("=")
+        label, env, results = args.label, list(args.env), []
+        for value in values.split(","):
+            args.env, args.label = env + [f"{key}={value}"], f"{label}-{key}{value}"
+            res = asyncio.run(run(args))
+            print_summary(res)
+            save(res)
+            results.append((value, res))
+        print_sweep(key, results)
+        return
+
+    res = asyncio.run(run(args))
+    print_summary(res)
+    save(res, args.out)
+
+
+if __name__ == "__main__":
+    main()
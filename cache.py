@@ -0,0 +1,223 @@
+# cache.py
+# Caché de respuestas por contenido: LRU en memoria + disco con desalojo por tamaño.
+#
+#   tts_cache: WAV 16k final por (modelo TTS, voz, texto normalizado)
+#   llm_cache: respuesta del LLM por (modelo, prompt de sistema, transcripción normalizada, temperatura),
+#              solo si la temperatura es <= LLM_CACHE_MAX_TEMP (con temperatura alta cada respuesta varía)
+#
+# Variables de entorno:
+#   CACHE=0              desactiva todo
+#   CACHE_DIR            carpeta en disco (default ./cache)
+#   CACHE_MEM_MB         tope en memoria por caché (default 32)
+#   CACHE_DISK_MB        tope en disco por caché (default 256)
+#   LLM_CACHE_MAX_TEMP   default 0.0 (solo respuestas deterministas)
+#
+# La memoria se consulta en el loop; el disco (leer, escribir, desalojar) va en hilos con
+# asyncio.to_thread y su propio lock, así un disco lento no frena a los demás requests.
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_text(text: str, loose: bool = False) -> str:
+    """
+    Normaliza para la llave. Estricto (TTS): solo espacios, la puntuación cambia la entonación.
+    Suelto (transcripciones): minúsculas, sin tildes ni puntuación, "¿Qué hora es?" == "que hora es".
+    """
+    text = " ".join((text or "").split())
+    if loose:
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        text = " ".join(re.sub(r"[^\w\s]", " ", text).split())
+    return text
+
+
+def cache_key(*parts) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, name: str, mem_max_bytes: int, disk_dir: str = None, disk_max_bytes: int = 0, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.mem_max_bytes = mem_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir and disk_max_bytes > 0 else None
+        self._mem = OrderedDict()     # key -> bytes, el más reciente al final
+        self._mem_bytes = 0
+        self._disk = OrderedDict()    # key -> tamaño, ordenado por último uso
+        self._disk_bytes = 0
+        self._lock = threading.Lock()        # memoria y stats: se toma desde el loop, nunca durante I/O
+        self._disk_lock = threading.Lock()   # índice y archivos del disco: solo en hilos
+        self._pending = set()                # escrituras a disco en curso
+        self.stats = {
+            "hits_mem": 0, "hits_disk": 0, "misses": 0,
+            "bytes_served": 0, "bytes_stored": 0, "evictions_mem": 0, "evictions_disk": 0,
+        }
+        if self.enabled and self.disk_dir:
+            self._load_disk_index()
+
+    # --- disco ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _load_disk_index(self):
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for fn in files:
+                if fn.endswith(".tmp"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, fn))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, fn, st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _disk_get(self, key: str):
+        """Bloqueante: correr en un hilo."""
+        with self._disk_lock:
+            if key not in self._disk:
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)   # el mtime hace de "último uso" si se reinicia el servidor
+            except OSError:
+                self._disk_bytes -= self._disk.pop(key, 0)
+                return None
+            self._disk.move_to_end(key)
+            return data
+
+    def _disk_put(self, key: str, value: bytes):
+        """Bloqueante: correr en un hilo."""
+        if len(value) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        evicted = 0
+        with self._disk_lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(value)
+                os.replace(tmp, path)   # atómico: nunca se lee un archivo a medias
+            except OSError as e:
+                print(f"[cache] {self.name}: no se pudo escribir en disco: {e}")
+                return
+            self._disk_bytes += len(value) - self._disk.pop(key, 0)
+            self._disk[key] = len(value)
+            while self._disk_bytes > self.disk_max_bytes and self._disk:
+                old, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted += 1
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+        if evicted:
+            with self._lock:
+                self.stats["evictions_disk"] += evicted
+
+    def _spawn_disk_put(self, key: str, value: bytes):
+        """Escribe en disco sin esperar (en un hilo); fuera de un loop, en el acto."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._disk_put(key, value)
+            return
+        task = asyncio.ensure_future(asyncio.to_thread(self._disk_put, key, value))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    # --- memoria ---
+
+    def _mem_put(self, key: str, value: bytes):
+        if len(value) > self.mem_max_bytes:
+            return
+        self._mem_bytes += len(value) - len(self._mem.pop(key, b""))
+        self._mem[key] = value
+        while self._mem_bytes > self.mem_max_bytes and self._mem:
+            _, old = self._mem.popitem(last=False)
+            self._mem_bytes -= len(old)
+            self.stats["evictions_mem"] += 1
+
+    # --- API ---
+
+    async def get(self, key: str):
+        """Memoria en el loop; si no está y el índice dice que hay archivo, se lee en un hilo."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._mem.get(key)
+            if value is not None:
+                self._mem.move_to_end(key)
+                self.stats["hits_mem"] += 1
+                self.stats["bytes_served"] += len(value)
+                return value
+        # mirar el índice sin _disk_lock (un "in" no se interrumpe a medias): un miss no salta a un hilo
+        if self.disk_dir and key in self._disk:
+            value = await asyncio.to_thread(self._disk_get, key)
+        with self._lock:
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self._mem_put(key, value)   # sube a memoria para el próximo
+            self.stats["hits_disk"] += 1
+            self.stats["bytes_served"] += len(value)
+            return value
+
+    def put(self, key: str, value: bytes):
+        """La memoria se actualiza ya; el disco se escribe en segundo plano."""
+        if not self.enabled or not value:
+            return
+        with self._lock:
+            self._mem_put(key, value)
+            self.stats["bytes_stored"] += len(value)
+        if self.disk_dir:
+            self._spawn_disk_put(key, value)
+
+    async def get_text(self, key: str):
+        value = await self.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def put_text(self, key: str, text: str):
+        self.put(key, text.encode("utf-8"))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(
+                self.stats,
+                enabled=self.enabled,
+                mem_entries=len(self._mem), mem_bytes=self._mem_bytes,
+                disk_entries=len(self._disk), disk_bytes=self._disk_bytes,
+            )
+
+
+CACHE_ENABLED = os.getenv("CACHE", "1") != "0"
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+_MEM = int(float(os.getenv("CACHE_MEM_MB", "32")) * 1024 * 1024)
+_DISK = int(float(os.getenv("CACHE_DISK_MB", "256")) * 1024 * 1024)
+LLM_CACHE_MAX_TEMP = float(os.getenv("LLM_CACHE_MAX_TEMP", "0.0"))
+
+tts_cache = ResponseCache("tts", _MEM, CACHE_DIR, _DISK, enabled=CACHE_ENABLED)
+llm_cache = ResponseCache("llm", _MEM // 8, CACHE_DIR, _DISK // 8, enabled=CACHE_ENABLED)
+
+
+def llm_cacheable(temperature: float) -> bool:
+    return CACHE_ENABLED and temperature <= LLM_CACHE_MAX_TEMP
+
+
+def cache_stats() -> dict:
+    return {"tts": tts_cache.snapshot(), "llm": llm_cache.snapshot()}
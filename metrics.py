@@ -0,0 +1,273 @@
+# metrics.py
+# Métricas por etapa en formato de texto Prometheus (/metrics) y cabecera Server-Timing.
+#
+#   teadoro_stage_seconds{stage,backend,model}   histograma por etapa (receive, normalize, stt, stt_failed,
+#                                                llm, tts, tts_first, tts_segment, convert, encode) + p50/p95/p99
+#   teadoro_request_seconds{route}               total del request (en streaming, hasta el último byte)
+#   teadoro_requests_in_flight{route}            requests en curso (los streams cuentan hasta terminar)
+#   teadoro_requests_total{route,status}
+#   teadoro_bytes_total{direction}               rx = audio subido, tx = audio enviado
+# más contadores de caché, VAD y pools de CPU.
+#
+# Sin dependencias: el registro es chico y todo corre en el event loop.
+
+import bisect
+import functools
+import time
+from collections import defaultdict
+
+from starlette.responses import StreamingResponse
+
+PREFIX = "teadoro"
+
+# segundos: de 5 ms (caché, VAD) a 60 s (el timeout del ESP32)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 20.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _num(v) -> str:
+    v = float(v)
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+def _labels(d: dict) -> str:
+    if not d:
+        return ""
+    inner = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for k, v in d.items())
+    return "{" + inner + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimación por interpolación lineal dentro del bucket (igual que histogram_quantile)."""
+        if self.count == 0:
+            return float("nan")
+        rank = q * self.count
+        acc = 0
+        for i, c in enumerate(self.counts):
+            if acc + c >= rank and c > 0:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lo   # cae en +Inf: lo mejor que sabemos es el último límite
+                hi = self.buckets[i]
+                return lo + (hi - lo) * (rank - acc) / c
+            acc += c
+        return self.buckets[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = defaultdict(dict)   # nombre -> {labels(tuple): Histogram}
+        self.counters = defaultdict(lambda: defaultdict(float))
+        self.gauges = defaultdict(lambda: defaultdict(float))
+        self.help = {}
+        self.collectors = []                  # funciones que devuelven [(tipo, nombre, labels, valor)]
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        h = self.histograms[name].get(key)
+        if h is None:
+            h = self.histograms[name][key] = Histogram()
+        h.observe(value)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def add_gauge(self, name: str, value: float, **labels):
+        self.gauges[name][tuple(sorted(labels.items()))] += value
+
+    def render(self) -> str:
+        out = []
+
+        def head(name, kind):
+            if name in self.help:
+                out.append(f"# HELP {name} {self.help[name]}")
+            out.append(f"# TYPE {name} {kind}")
+
+        for name, series in sorted(self.histograms.items()):
+            head(name, "histogram")
+            for key, h in sorted(series.items()):
+                labels = dict(key)
+                acc = 0
+                for b, c in zip(h.buckets, h.counts):
+                    acc += c
+                    out.append(f"{name}_bucket{_labels({**labels, 'le': repr(b)})} {acc}")
+                out.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {h.count}")
+                out.append(f"{name}_sum{_labels(labels)} {h.sum:.6f}")
+                out.append(f"{name}_count{_labels(labels)} {h.count}")
+            # p50/p95/p99 ya calculados, para mirar sin PromQL
+            qname = f"{name}_quantile"
+            head(qname, "gauge")
+            for key, h in sorted(series.items()):
+                for q in QUANTILES:
+                    out.append(f"{qname}{_labels({**dict(key), 'quantile': q})} {h.quantile(q):.6f}")
+
+        for kind, table in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, series in sorted(table.items()):
+                head(name, kind)
+                for key, v in sorted(series.items()):
+                    out.append(f"{name}{_labels(dict(key))} {_num(v)}")
+
+        extra = defaultdict(list)
+        for collect in self.collectors:
+            for kind, name, labels, value in collect():
+                extra[(name, kind)].append((labels, value))
+        for (name, kind), rows in sorted(extra.items()):
+            head(name, kind)
+            for labels, value in rows:
+                out.append(f"{name}{_labels(labels)} {_num(value)}")
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+STAGE = f"{PREFIX}_stage_seconds"
+REQUEST = f"{PREFIX}_request_seconds"
+IN_FLIGHT = f"{PREFIX}_requests_in_flight"
+REQUESTS = f"{PREFIX}_requests_total"
+BYTES = f"{PREFIX}_bytes_total"
+registry.help.update({
+    STAGE: "Duración por etapa del pipeline",
+    REQUEST: "Duración total del request",
+    IN_FLIGHT: "Requests en curso",
+    REQUESTS: "Requests terminados",
+    BYTES: "Bytes de audio recibidos (rx) y enviados (tx)",
+})
+
+
+def observe_stage(stage: str, seconds: float, backend: str = "", model: str = ""):
+    registry.observe(STAGE, seconds, stage=stage, backend=backend, model=model)
+
+
+def record_stage(timer, stage: str, seconds: float, backend: str = "", model: str = ""):
+    """Al RequestTimer si hay uno (sale en Server-Timing), si no solo al histograma."""
+    if timer is not None:
+        timer.record(stage, seconds, backend, model)
+    else:
+        observe_stage(stage, seconds, backend, model)
+
+
+def count_bytes(direction: str, n: int):
+    registry.inc(BYTES, n, direction=direction)
+
+
+class RequestTimer:
+    """
+    Tiempos de un request: cada etapa va al histograma y a la cabecera Server-Timing.
+    Se crea al empezar (suma a in-flight) y finish() lo cierra una sola vez.
+    """
+
+    def __init__(self, route: str):
+        self.route = route
+        self.t0 = time.perf_counter()
+        self.stages = []
+        self._done = False
+        registry.add_gauge(IN_FLIGHT, 1, route=route)
+
+    def record(self, stage: str, seconds: float, backend: str = "", model: str = ""):
+        self.stages.append((stage, seconds))
+        observe_stage(stage, seconds, backend, model)
+
+    def since(self, stage: str, t_start: float, backend: str = "", model: str = "") -> float:
+        """Registra la etapa desde t_start (perf_counter) hasta ahora y devuelve ahora."""
+        now = time.perf_counter()
+        self.record(stage, now - t_start, backend, model)
+        return now
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={sec * 1000:.1f}" for name, sec in self.stages]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def finish(self, status: int):
+        if self._done:
+            return
+        self._done = True
+        registry.observe(REQUEST, self.elapsed(), route=self.route)
+        registry.add_gauge(IN_FLIGHT, -1, route=self.route)
+        registry.inc(REQUESTS, route=self.route, status=status)
+
+    async def wrap_stream(self, stream, status: int = 200):
+        """Cuenta bytes tx y cierra el timer cuando el stream termina (o el cliente se va)."""
+        try:
+            async for chunk in stream:
+                count_bytes("tx", len(chunk))
+                yield chunk
+        finally:
+            self.finish(status)
+
+
+def instrumented(route: str):
+    """
+    Decorador para handlers HTTP: deja un RequestTimer en request.state.timer, agrega
+    Server-Timing a la respuesta y mantiene in-flight/bytes/total. El handler debe
+    recibir `request` como argumento con nombre.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            request = kwargs["request"]
+            timer = request.state.timer = RequestTimer(route)
+            try:
+                resp = await fn(*args, **kwargs)
+            except BaseException:
+                timer.finish(500)
+                raise
+            resp.headers["Server-Timing"] = timer.server_timing()
+            if isinstance(resp, StreamingResponse):
+                resp.body_iterator = timer.wrap_stream(resp.body_iterator, resp.status_code)
+            else:
+                count_bytes("tx", len(resp.body or b""))
+                timer.finish(resp.status_code)
+            return resp
+        return wrapper
+    return deco
+
+
+# --- colectores de otros módulos ---
+
+def _collect_cache():
+    from cache import cache_stats
+    rows = []
+    for name, st in cache_stats().items():
+        for k in ("hits_mem", "hits_disk", "misses", "bytes_served", "bytes_stored", "evictions_mem", "evictions_disk"):
+            rows.append(("counter", f"{PREFIX}_cache_{k}_total", {"cache": name}, st[k]))
+        for k in ("mem_bytes", "disk_bytes", "mem_entries", "disk_entries"):
+            rows.append(("gauge", f"{PREFIX}_cache_{k}", {"cache": name}, st[k]))
+    return rows
+
+
+def _collect_vad():
+    from vad import totals
+    return [
+        ("counter", f"{PREFIX}_vad_requests_total", {}, totals["requests"]),
+        ("counter", f"{PREFIX}_vad_no_speech_total", {}, totals["no_speech"]),
+        ("counter", f"{PREFIX}_vad_audio_seconds_in_total", {}, totals["seconds_in"]),
+        ("counter", f"{PREFIX}_vad_audio_seconds_out_total", {}, totals["seconds_out"]),
+    ]
+
+
+def _collect_pools():
+    from workers import audio_pool, stt_pool
+    return [("gauge", f"{PREFIX}_pool_in_flight", {"pool": p.name}, p.in_flight) for p in (stt_pool, audio_pool)]
+
+
+registry.collectors += [_collect_cache, _collect_vad, _collect_pools]
+
+
+def render() -> str:
+    return registry.render()
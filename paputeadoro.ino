@@ -198,8 +198,13 @@ bool post_and_stream_play(const char* inPath) {
   String url = String("http://") + SERVER_HOST + ":" + SERVER_PORT + URL_PTT;
 
   if (!http.begin(client, url)) { fin.close(); return false; }
+  // HTTP/1.0: la respuesta en streaming llega cruda hasta que se cierra la conexión.
+  // Con 1.1 el servidor la manda "chunked" y getStreamPtr() no quita los tamaños de bloque.
+  http.useHTTP10(true);
   http.addHeader("Content-Type", "audio/wav");
   http.addHeader("Connection", "close");
+  // turno propio en el servidor aunque varios equipos salgan por la misma IP (NAT)
+  http.addHeader("X-Device-Id", WiFi.macAddress());
   http.setTimeout(60000);
 
   Serial.printf("[HTTP] POST %s (%u bytes)\n", url.c_str(), (unsigned)fin.size());
@@ -229,7 +234,7 @@ bool post_and_stream_play(const char* inPath) {
   Serial.println("[STREAM] Reproduciendo en streaming...");
   static uint8_t buf[1024];
   uint32_t t0 = millis(), last = t0;
-  while (http.connected()) {
+  while (http.connected() || s->available() > 0) {   // lo que quede en el buffer tras el cierre
     int a = s->available();
     if (a > 0) {
       int r = s->readBytes(buf, a > (int)sizeof(buf) ? (int)sizeof(buf) : a);
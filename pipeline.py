@@ -0,0 +1,176 @@
+# pipeline.py
+# LLM en streaming -> cortes por frase -> TTS por frase en paralelo -> un solo WAV en orden.
+#
+# La primera frase empieza a sonar apenas el LLM la termina, mientras las siguientes
+# se sintetizan en paralelo (TTS_SEGMENT_CONCURRENCY). Así una respuesta larga cuesta
+# más o menos la misma latencia percibida que una de 30 tokens.
+
+import asyncio
+import os
+import re
+
+from reply_format import DEFAULT_FORMAT, ReplyFormat
+
+TTS_SEGMENT_CONCURRENCY = max(1, int(os.getenv("TTS_SEGMENT_CONCURRENCY", "3")))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "150"))
+
+# fin de oración (. ! ? …) o de cláusula (, ; :) seguido de espacio
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'»)\]]*\s")
+_CLAUSE_END = re.compile(r"[,;:]\s")
+
+
+class SentenceSplitter:
+    """
+    Va juntando deltas del LLM y entrega segmentos completos. Corta siempre en fin de
+    oración; en comas solo si el segmento ya es largo (min_clause), para no mandar al
+    TTS trozos de dos palabras que suenan cortados. El primer segmento se corta antes
+    (first_min) porque es el que define la latencia.
+    """
+
+    def __init__(self, min_clause: int = 60, first_min: int = 20):
+        self.min_clause = min_clause
+        self.first_min = first_min
+        self._buf = ""
+        self._emitted = 0
+
+    def _cut(self):
+        m = _SENTENCE_END.search(self._buf)
+        if m:
+            return m.end()
+        limit = self.first_min if self._emitted == 0 else self.min_clause
+        for m in _CLAUSE_END.finditer(self._buf):
+            if m.end() >= limit:
+                return m.end()
+        return None
+
+    def feed(self, delta: str) -> list:
+        self._buf += delta
+        out = []
+        while (end := self._cut()) is not None:
+            seg, self._buf = self._buf[:end].strip(), self._buf[end:]
+            if seg:
+                out.append(seg)
+                self._emitted += 1
+        return out
+
+    def flush(self) -> list:
+        seg, self._buf = self._buf.strip(), ""
+        return [seg] if seg else []
+
+
+async def llm_text_stream(client, model: str, messages: list, temperature: float, max_tokens: int):
+    """Deltas de texto del LLM (Responses API con stream=True)."""
+    stream = await client.responses.create(
+        model=model,
+        input=messages,
+        temperature=temperature,
+        max_output_tokens=max_tokens,
+        stream=True,
+    )
+    async for event in stream:
+        etype = getattr(event, "type", "")
+        if etype == "response.output_text.delta":
+            yield event.delta
+        elif etype in ("error", "response.failed"):
+            raise RuntimeError(f"LLM stream: {etype}")
+
+
+async def _segments(text_stream, on_text=None):
+    splitter = SentenceSplitter()
+    parts = []
+    async for delta in text_stream:
+        parts.append(delta)
+        for seg in splitter.feed(delta):
+            yield seg
+    for seg in splitter.flush():
+        yield seg
+    if on_text is not None:
+        on_text("".join(parts).strip())
+
+
+async def _single(text: str):
+    yield text
+
+
+async def speak_segments(tts, segments, concurrency: int = TTS_SEGMENT_CONCURRENCY):
+    """
+    PCM 16 kHz en orden de los segmentos (tts: backend con pcm_stream, ver backends.py). Cada segmento tiene su cola: el TTS de los
+    siguientes corre en paralelo y se va guardando mientras suena el anterior.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    order = asyncio.Queue()   # colas por segmento, en orden; None = no hay más
+    tasks = []
+
+    async def synth(seg, q):
+        try:
+            async with sem:
+                async for pcm in tts.pcm_stream(seg):
+                    q.put_nowait(pcm)
+        except Exception as e:
+            q.put_nowait(e)
+        finally:
+            q.put_nowait(None)
+
+    async def produce():
+        try:
+            async for seg in segments:
+                q = asyncio.Queue()
+                tasks.append(asyncio.create_task(synth(seg, q)))
+                order.put_nowait(q)
+        except Exception as e:
+            order.put_nowait(e)
+        finally:
+            order.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (q := await order.get()) is not None:
+            if isinstance(q, Exception):
+                raise q
+            while (item := await q.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        producer.cancel()
+        for t in tasks:
+            t.cancel()
+
+
+async def open_reply_stream(client, tts, model: str, messages: list, temperature: float,
+                            max_tokens: int = LLM_MAX_TOKENS, cached_text: str = None, on_text=None,
+                            header: bool = True, fmt: ReplyFormat = DEFAULT_FORMAT):
+    """
+    Arranca LLM (client) -> TTS (tts) por frases y espera el primer bloque de audio, así los errores
+    todavía se pueden responder como 500. Devuelve (primer_bloque, iterador WAV completo).
+    Con cached_text (respuesta del LLM en caché) se salta el LLM. on_text recibe el
+    texto completo cuando el LLM termina. header=False entrega el audio sin cabecera (WebSocket).
+    fmt: formato negociado (reply_format.py); se codifica bloque a bloque a medida que sale.
+    """
+    if cached_text is not None:
+        segs = _segments(_single(cached_text), on_text)
+    else:
+        segs = _segments(llm_text_stream(client, model, messages, temperature, max_tokens), on_text)
+
+    pcm = speak_segments(tts, segs)
+    enc = fmt.encoder()
+    first = fmt.header() if header else b""
+    async for chunk in pcm:
+        first += enc.feed(chunk)
+        break
+
+    async def chained():
+        yield first
+        try:
+            async for chunk in pcm:
+                out = enc.feed(chunk)
+                if out:
+                    yield out
+        except Exception as e:
+            # ya se mandó audio: se corta aquí y el ESP32 reproduce lo que alcanzó a llegar
+            print(f"[ptt] Error LLM/TTS a mitad del stream: {e}")
+        tail = enc.flush()
+        if tail:
+            yield tail
+
+    return first, chained()
@@ -0,0 +1,289 @@
+# reply_format.py
+# Formatos compactos para el audio de respuesta, negociados por request (o por conexión en /ws/ptt).
+#
+#   ?codec=adpcm&rate=8000                       query string
+#   Accept: audio/wav; codec=ulaw; rate=8000     cabecera (se ignora si no la entendemos)
+#
+#   pcm    16-bit               32 KB/s a 16 kHz (default: lo que ya reproduce el firmware)
+#   ulaw   G.711 μ-law          2:1, una tabla de 64 K entradas (un solo indexado por bloque)
+#   adpcm  IMA-ADPCM (WAV 0x11) 4:1, bloques de 256 bytes = 505 muestras, cada uno con su predictor
+# rate=8000 vuelve a dividir a la mitad (la voz del TTS casi no tiene energía sobre 4 kHz).
+#
+# Los encoders trabajan por bloques de streaming (ReplyEncoder.feed/flush) y el resultado es
+# idéntico al de codificar todo de una vez. Los decoders están para bench/ y ws_client.py.
+
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from audio import (SR_OUT, WAV_STREAM_SIZE, WAVE_FORMAT_IMA_ADPCM, WAVE_FORMAT_MULAW, WAVE_FORMAT_PCM,
+                   StreamResampler, parse_wav, wav_header)
+
+CODECS = ("pcm", "ulaw", "adpcm")
+RATES = (SR_OUT, 8000)
+
+# --- G.711 μ-law ---
+
+_ULAW_BIAS = 0x84
+
+
+def _ulaw_tables():
+    # igual que la referencia de la ITU/Sun (g711.c): se trabaja en 14 bits, negativos con >> aritmético
+    x = np.arange(-32768, 32768, dtype=np.int32)
+    sign = np.where(x < 0, 0x80, 0)
+    mag = np.minimum(np.abs(x >> 2), 8159) + (_ULAW_BIAS >> 2)
+    exp = np.floor(np.log2(mag)).astype(np.int32) - 5
+    mant = np.where(exp > 7, 0x0F, (mag >> (exp + 1)) & 0x0F)   # fuera del último segmento: satura
+    exp = np.minimum(exp, 7)
+    enc = np.empty(65536, dtype=np.uint8)
+    enc[x & 0xFFFF] = (~(sign | (exp << 4) | mant)) & 0xFF   # indexado por el int16 visto como uint16
+
+    b = ~np.arange(256, dtype=np.int32) & 0xFF
+    mag = (((b & 0x0F) << 3) + _ULAW_BIAS) << ((b >> 4) & 0x07)
+    dec = np.where(b & 0x80, _ULAW_BIAS - mag, mag - _ULAW_BIAS).astype(np.int16)
+    return enc, dec
+
+
+_ULAW_ENC, _ULAW_DEC = _ulaw_tables()
+
+
+def ulaw_encode(pcm: np.ndarray) -> bytes:
+    """int16 -> bytes μ-law."""
+    return _ULAW_ENC[pcm.view(np.uint16)].tobytes()
+
+
+def ulaw_decode(data) -> np.ndarray:
+    return _ULAW_DEC[np.frombuffer(data, dtype=np.uint8)]
+
+
+# --- IMA-ADPCM (formato de bloques de Microsoft, mono) ---
+
+ADPCM_BLOCK_ALIGN = 256
+ADPCM_BLOCK_SAMPLES = (ADPCM_BLOCK_ALIGN - 4) * 2 + 1   # la primera va entera en la cabecera del bloque
+# desde cuántos bloques conviene el camino NumPy (una pasada por muestra con todos los bloques a la vez);
+# con menos, el costo fijo de ~500 iteraciones NumPy pierde contra el bucle en Python (ver bench/bench_codecs.py)
+ADPCM_VECTOR_MIN = 40
+
+_STEP = [7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80,
+         88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598,
+         658, 724, 796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+         3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289,
+         16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767]
+_INDEX_ADJ = [-1, -1, -1, -1, 2, 4, 6, 8]
+# diferencia reconstruida y próximo índice por (índice, magnitud): exactamente lo que hace el decoder
+_DQ = [[(s >> 3) + (s if m & 4 else 0) + (s >> 1 if m & 2 else 0) + (s >> 2 if m & 1 else 0) for m in range(8)]
+       for s in _STEP]
+_NEXT = [[min(88, max(0, i + _INDEX_ADJ[m])) for m in range(8)] for i in range(len(_STEP))]
+_STEP_A = np.array(_STEP, dtype=np.int32)
+_DQ_A = np.array(_DQ, dtype=np.int32)
+_NEXT_A = np.array(_NEXT, dtype=np.int32)
+
+
+def _initial_index(blocks: np.ndarray) -> np.ndarray:
+    """Cada bloque arranca con un paso parecido a sus primeras diferencias (no hereda del anterior)."""
+    d = np.abs(np.diff(blocks[:, :9], axis=1)).mean(axis=1)
+    return np.clip(np.searchsorted(_STEP_A, d), 0, 88).astype(np.int32)
+
+
+def _nibbles_py(block: list, idx: int) -> list:
+    pred = block[0]
+    out = []
+    for v in block[1:]:
+        d = v - pred
+        if d < 0:
+            m = min(7, ((-d) << 2) // _STEP[idx])
+            pred = max(-32768, pred - _DQ[idx][m])
+            out.append(m | 8)
+        else:
+            m = min(7, (d << 2) // _STEP[idx])
+            pred = min(32767, pred + _DQ[idx][m])
+            out.append(m)
+        idx = _NEXT[idx][m]
+    return out
+
+
+def _nibbles_np(blocks: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    pred = blocks[:, 0].copy()
+    nibs = np.empty((len(blocks), ADPCM_BLOCK_SAMPLES - 1), dtype=np.uint8)
+    for i in range(1, ADPCM_BLOCK_SAMPLES):
+        d = blocks[:, i] - pred
+        neg = d < 0
+        m = np.minimum((np.abs(d) << 2) // _STEP_A[idx], 7)
+        dq = _DQ_A[idx, m]
+        pred = np.clip(np.where(neg, pred - dq, pred + dq), -32768, 32767)
+        idx = _NEXT_A[idx, m]
+        nibs[:, i - 1] = m | (neg << 3)
+    return nibs
+
+
+def adpcm_encode(pcm: np.ndarray) -> bytes:
+    """int16 con largo múltiplo de ADPCM_BLOCK_SAMPLES -> bloques IMA-ADPCM de ADPCM_BLOCK_ALIGN bytes."""
+    blocks = pcm.astype(np.int32).reshape(-1, ADPCM_BLOCK_SAMPLES)
+    if len(blocks) == 0:
+        return b""
+    idx0 = _initial_index(blocks)
+    if len(blocks) >= ADPCM_VECTOR_MIN:
+        nibs = _nibbles_np(blocks, idx0)
+    else:
+        nibs = np.array([_nibbles_py(b, i) for b, i in zip(blocks.tolist(), idx0.tolist())], dtype=np.uint8)
+    out = np.empty((len(blocks), ADPCM_BLOCK_ALIGN), dtype=np.uint8)
+    head = out[:, :4].view("<i2")
+    head[:, 0] = blocks[:, 0]
+    out[:, 2] = idx0
+    out[:, 3] = 0
+    out[:, 4:] = nibs[:, 0::2] | (nibs[:, 1::2] << 4)   # nibble bajo primero
+    return out.tobytes()
+
+
+def adpcm_decode(data, block_align: int = ADPCM_BLOCK_ALIGN) -> np.ndarray:
+    """Bloques IMA-ADPCM mono -> int16 (todos los bloques en paralelo, una pasada por muestra)."""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    raw = raw[: len(raw) // block_align * block_align].reshape(-1, block_align)
+    n = (block_align - 4) * 2 + 1
+    out = np.empty((len(raw), n), dtype=np.int16)
+    pred = raw[:, :2].copy().view("<i2")[:, 0].astype(np.int32)
+    idx = np.minimum(raw[:, 2].astype(np.int32), 88)
+    nibs = np.empty((len(raw), n - 1), dtype=np.int32)
+    nibs[:, 0::2] = raw[:, 4:] & 0x0F
+    nibs[:, 1::2] = raw[:, 4:] >> 4
+    out[:, 0] = pred
+    for i in range(1, n):
+        nib = nibs[:, i - 1]
+        m = nib & 7
+        dq = _DQ_A[idx, m]
+        pred = np.clip(np.where(nib & 8, pred - dq, pred + dq), -32768, 32767)
+        idx = _NEXT_A[idx, m]
+        out[:, i] = pred
+    return out.reshape(-1)
+
+
+# --- Negociación y encoder por bloques ---
+
+class ReplyFormat(namedtuple("ReplyFormat", "codec rate")):
+    @property
+    def name(self) -> str:
+        return f"{self.codec}@{self.rate}"
+
+    @property
+    def is_default(self) -> bool:
+        return self == DEFAULT_FORMAT
+
+    @property
+    def block_align(self) -> int:
+        return {"pcm": 2, "ulaw": 1, "adpcm": ADPCM_BLOCK_ALIGN}[self.codec]
+
+    def header(self, data_size: int = WAV_STREAM_SIZE) -> bytes:
+        """Cabecera WAV del formato; sin data_size queda como WAV streaming (largo desconocido)."""
+        if self.codec == "pcm":
+            return wav_header(self.rate, data_size)
+        if self.codec == "ulaw":
+            code, bits, byte_rate, extra = WAVE_FORMAT_MULAW, 8, self.rate, struct.pack("<H", 0)
+            samples = data_size
+        else:
+            code, bits, extra = WAVE_FORMAT_IMA_ADPCM, 4, struct.pack("<HH", 2, ADPCM_BLOCK_SAMPLES)
+            byte_rate = self.rate * ADPCM_BLOCK_ALIGN // ADPCM_BLOCK_SAMPLES
+            samples = data_size // ADPCM_BLOCK_ALIGN * ADPCM_BLOCK_SAMPLES
+        fmt = struct.pack("<HHIIHH", code, 1, self.rate, byte_rate, self.block_align, bits) + extra
+        fact = b"fact" + struct.pack("<II", 4, min(samples, WAV_STREAM_SIZE))
+        riff_size = min(4 + 8 + len(fmt) + len(fact) + 8 + data_size, WAV_STREAM_SIZE)
+        return (b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+                + b"fmt " + struct.pack("<I", len(fmt)) + fmt + fact
+                + b"data" + struct.pack("<I", data_size))
+
+    def encoder(self) -> "ReplyEncoder":
+        return ReplyEncoder(self)
+
+    def encode_wav(self, wav16k: bytes) -> bytes:
+        """WAV 16k/16-bit/mono completo -> WAV del formato (para el modo sin streaming; corre en audio_pool)."""
+        if self.is_default:
+            return wav16k
+        enc = self.encoder()
+        body = enc.feed(parse_wav(wav16k).data) + enc.flush()
+        return self.header(len(body)) + body
+
+
+DEFAULT_FORMAT = ReplyFormat("pcm", SR_OUT)
+
+
+class ReplyEncoder:
+    """PCM 16 kHz/16-bit en bloques de cualquier tamaño -> bytes del formato, en bloques completos."""
+
+    def __init__(self, fmt: ReplyFormat):
+        self.fmt = fmt
+        self._rs = StreamResampler(SR_OUT, fmt.rate) if fmt.rate != SR_OUT else None
+        self._odd = b""
+        self._pending = np.zeros(0, dtype=np.int16)   # ADPCM: muestras que todavía no llenan un bloque
+
+    def _encode(self, pcm: bytes, final: bool = False) -> bytes:
+        x = np.frombuffer(pcm, dtype="<i2")
+        if self.fmt.codec == "ulaw":
+            return ulaw_encode(x)
+        x = np.concatenate([self._pending, x])
+        if final and len(x) % ADPCM_BLOCK_SAMPLES:
+            # el último bloque se completa repitiendo la última muestra (WAV ADPCM va en bloques enteros)
+            pad = ADPCM_BLOCK_SAMPLES - len(x) % ADPCM_BLOCK_SAMPLES
+            x = np.concatenate([x, np.full(pad, x[-1], dtype=np.int16)])
+        cut = len(x) // ADPCM_BLOCK_SAMPLES * ADPCM_BLOCK_SAMPLES
+        self._pending = x[cut:]
+        return adpcm_encode(x[:cut])
+
+    def feed(self, pcm16k) -> bytes:
+        if self.fmt.is_default:
+            return bytes(pcm16k)
+        data = self._odd + bytes(pcm16k)
+        cut = len(data) - (len(data) % 2)
+        self._odd, data = data[cut:], data[:cut]
+        if self._rs is not None:
+            data = self._rs.feed(data)
+        return data if self.fmt.codec == "pcm" else self._encode(data)
+
+    def flush(self) -> bytes:
+        if self.fmt.is_default:
+            return b""
+        data = self._rs.flush() if self._rs is not None else b""
+        self._odd = b""
+        return data if self.fmt.codec == "pcm" else self._encode(data, final=True)
+
+
+def _parse(codec: str, rate) -> ReplyFormat:
+    codec = (codec or "pcm").strip().lower()
+    codec = {"mulaw": "ulaw", "g711": "ulaw", "ima": "adpcm", "ima-adpcm": "adpcm"}.get(codec, codec)
+    rate = int(rate) if rate else SR_OUT
+    if codec not in CODECS:
+        raise ValueError(f"codec desconocido: {codec!r} (opciones: {', '.join(CODECS)})")
+    if rate not in RATES:
+        raise ValueError(f"rate no soportado: {rate} (opciones: {', '.join(map(str, RATES))})")
+    return ReplyFormat(codec, rate)
+
+
+def negotiate(query_params, accept: str = None) -> ReplyFormat:
+    """
+    Formato pedido por query (?codec=&rate=) o, si no, por Accept (audio/wav; codec=...; rate=...).
+    Query inválido -> ValueError (400); un Accept que no entendemos se ignora (PCM 16k).
+    """
+    if query_params.get("codec") or query_params.get("rate"):
+        return _parse(query_params.get("codec"), query_params.get("rate"))
+    for media in (accept or "").split(","):
+        parts = [p.strip() for p in media.split(";")]
+        if parts[0].lower() not in ("audio/wav", "audio/x-wav", "audio/*"):
+            continue
+        params = dict(p.split("=", 1) for p in parts[1:] if "=" in p)
+        if "codec" in params or "rate" in params:
+            try:
+                return _parse(params.get("codec"), params.get("rate"))
+            except ValueError:
+                continue
+    return DEFAULT_FORMAT
+
+
+def decode_wav(data) -> tuple:
+    """WAV PCM / μ-law / IMA-ADPCM mono -> (int16, sample_rate)."""
+    info = parse_wav(data)
+    if info.fmt == WAVE_FORMAT_PCM and info.bits == 16:
+        return np.frombuffer(info.data, dtype="<i2", count=len(info.data) // 2), info.sample_rate
+    if info.fmt == WAVE_FORMAT_MULAW:
+        return ulaw_decode(info.data), info.sample_rate
+    if info.fmt == WAVE_FORMAT_IMA_ADPCM:
+        return adpcm_decode(info.data, info.block_align), info.sample_rate
+    raise ValueError(f"formato WAV no soportado: 0x{info.fmt:04x}/{info.bits} bits")
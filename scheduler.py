@@ -0,0 +1,261 @@
+# scheduler.py
+# Control de admisión para /api/ptt: cola acotada, un request a la vez por dispositivo,
+# uploads idénticos en curso comparten resultado y, si no hay lugar, 503 + Retry-After al tiro.
+#
+# El firmware espera hasta 60 s y la gente vuelve a apretar el botón cuando tarda: sin esto,
+# cada reintento es otro STT -> LLM -> TTS completo compitiendo con el original.
+#
+#   SCHED_MAX_ACTIVE     pipelines corriendo a la vez (default 16)
+#   SCHED_MAX_QUEUE      requests esperando turno; más que eso -> 503 (default 32)
+#   SCHED_QUEUE_TIMEOUT  segundos máximos en cola antes de rendirse con 503 (default 20)
+#   SCHED_DEDUP=0        desactiva la deduplicación por hash del audio
+#
+# Un request en streaming ocupa su lugar hasta que termina de generarse el audio.
+#
+# El turno por dispositivo sale de ?device= o X-Device-Id (el firmware manda su MAC). Sin eso no
+# hay turno propio: detrás de un NAT todos los ESP32 comparten IP y se bloquearían entre ellos.
+
+import asyncio
+import hashlib
+import math
+import os
+import time
+from typing import Optional
+
+from fastapi.responses import Response
+from starlette.responses import StreamingResponse
+
+import metrics
+
+SCHED_DEDUP = os.getenv("SCHED_DEDUP", "1") != "0"
+EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """No hay lugar (o se acabó el tiempo en cola): se responde 503 con Retry-After."""
+
+    def __init__(self, msg: str, retry_after: int):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+    def response(self) -> Response:
+        return Response(content=f"Ocupado: {self}", status_code=503,
+                        headers={"Retry-After": str(self.retry_after)})
+
+
+class _Broadcast:
+    """
+    Reparte un stream de audio a varios clientes: una tarea lo consume una sola vez y cada
+    suscriptor lo lee desde el principio. Si todos se van antes de que termine, se cancela.
+    """
+
+    def __init__(self, source, on_done):
+        self.chunks = []
+        self.done = False
+        self.listeners = 0
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._pump(source, on_done))
+
+    async def _pump(self, source, on_done):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._changed.set()
+                self._changed = asyncio.Event()
+        finally:
+            self.done = True
+            self._changed.set()
+            on_done()
+
+    def stream(self):
+        self.listeners += 1   # se cuenta al crear la respuesta, no al empezar a leer
+        return self._read()
+
+    async def _read(self):
+        i = 0
+        try:
+            while True:
+                while i < len(self.chunks):
+                    yield self.chunks[i]
+                    i += 1
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            self.listeners -= 1
+            if self.listeners == 0 and not self.done:
+                self._task.cancel()
+
+
+class _Result:
+    """La respuesta del pipeline, reproducible para cada request que la comparte."""
+
+    def __init__(self, resp: Response, on_done):
+        self.status_code = resp.status_code
+        self.media_type = resp.media_type
+        if isinstance(resp, StreamingResponse):
+            self.body, self.broadcast = None, _Broadcast(resp.body_iterator, on_done)
+        else:
+            self.body, self.broadcast = resp.body, None
+            on_done()
+
+    def response(self) -> Response:
+        if self.broadcast is not None:
+            return StreamingResponse(self.broadcast.stream(), status_code=self.status_code, media_type=self.media_type)
+        return Response(content=self.body, status_code=self.status_code, media_type=self.media_type)
+
+
+class PttScheduler:
+    def __init__(self, max_active: int = 16, max_queue: int = 32, queue_timeout: float = 20.0,
+                 dedup: bool = True):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.dedup = dedup
+        self.queued = 0
+        self.active = 0
+        self.service_s = 3.0          # EWMA de lo que dura un pipeline (para Retry-After)
+        self.stats = {"admitted": 0, "deduped": 0, "rejected": 0, "timeouts": 0}
+        self._sem = None
+        self._inflight = {}           # hash del upload -> future con el _Result
+        self._devices = {}            # dispositivo -> [lock, requests que lo usan]
+
+    def retry_after(self) -> int:
+        """Segundos hasta que probablemente haya lugar: cola * duración media / paralelismo."""
+        wait = (self.queued + 1) * self.service_s / self.max_active
+        return int(min(30, max(1, math.ceil(wait))))
+
+    def check(self):
+        """
+        Rechazo inmediato si la cola ya está llena (no se espera el timeout para decir que no).
+        Cuenta todo lo admitido o esperando: así una ráfaga en el mismo tick no se cuela.
+        """
+        if self.queued + self.active >= self.max_active + self.max_queue:
+            self.stats["rejected"] += 1
+            raise Overloaded(f"cola llena ({self.queued} esperando)", self.retry_after())
+
+    @staticmethod
+    async def _acquire(prim, deadline: float):
+        """Lock/Semaphore con plazo (hora del loop); lanza TimeoutError si no llega a tiempo."""
+        async with asyncio.timeout_at(deadline):
+            await prim.acquire()
+
+    async def submit(self, device: Optional[str], key: str, run, timer: metrics.RequestTimer) -> Response:
+        """
+        run() -> Response corre el pipeline. Con el mismo key en curso no se vuelve a correr:
+        se espera y se comparte el resultado; si el original se cancela, este vuelve a entrar
+        y lo corre él. Lanza Overloaded si no hay lugar.
+        device=None: sin turno por dispositivo, solo el límite global.
+        """
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_active)
+
+        if self.dedup and key in self._inflight:
+            self.stats["deduped"] += 1
+            t0 = time.perf_counter()
+            shared = self._inflight[key]
+            try:
+                result = await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                # se canceló el original (su cliente se fue), no este: corre el pipeline por su cuenta
+                if not shared.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                timer.since("dedup", t0)
+                return await self.submit(device, key, run, timer)
+            timer.since("dedup", t0)
+            return result.response()
+
+        self.check()
+        self.queued += 1   # en cola desde que entra hasta que tiene lugar (lo baja "queue" en release)
+        fut = asyncio.get_running_loop().create_future()
+        if self.dedup:
+            self._inflight[key] = fut
+        entry = self._devices.setdefault(device, [asyncio.Lock(), 0]) if device is not None else None
+        if entry is not None:
+            entry[1] += 1
+        held = ["queue"]   # lo que hay que soltar al terminar: "queue", "device", "slot"
+
+        def release():
+            if "queue" in held:
+                self.queued -= 1
+            if "slot" in held:
+                self._sem.release()
+                self.active -= 1
+                self.service_s += EWMA_ALPHA * (time.perf_counter() - t_run - self.service_s)
+            if "device" in held:
+                entry[0].release()
+            held.clear()
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._devices.pop(device, None)
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+
+        deadline = asyncio.get_running_loop().time() + self.queue_timeout
+        t0 = t_run = time.perf_counter()
+        try:
+            try:
+                # primero el turno del dispositivo (no ocupa un lugar global mientras espera a su propio request)
+                if entry is not None:
+                    await self._acquire(entry[0], deadline)
+                    held.append("device")
+                await self._acquire(self._sem, deadline)
+                held.append("slot")
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise Overloaded(f"más de {self.queue_timeout:.0f} s en cola", self.retry_after())
+
+            held.remove("queue")
+            self.queued -= 1
+            self.active += 1
+            self.stats["admitted"] += 1
+            t_run = timer.since("queue", t0)
+            result = _Result(await run(), release)
+        except BaseException as e:
+            release()
+            if not fut.done():
+                if isinstance(e, asyncio.CancelledError):
+                    fut.cancel()
+                else:
+                    fut.set_exception(e)
+                    fut.exception()   # marcada como vista: si nadie más la esperaba no hay warning
+            raise
+        fut.set_result(result)
+        return result.response()
+
+    def snapshot(self) -> dict:
+        return {"queued": self.queued, "active": self.active, "max_active": self.max_active,
+                "max_queue": self.max_queue, "devices": len(self._devices),
+                "service_s": round(self.service_s, 3), **self.stats}
+
+
+def upload_key(body: bytes, *parts) -> str:
+    """Llave de deduplicación: hash del audio subido + lo que cambie la respuesta (formato)."""
+    return ":".join(map(str, parts + (hashlib.sha256(body).hexdigest(),)))
+
+
+def device_id(request) -> Optional[str]:
+    """?device= o X-Device-Id; la IP no sirve (varios ESP32 detrás de un NAT), así que si no viene -> None."""
+    return request.query_params.get("device") or request.headers.get("x-device-id") or None
+
+
+ptt_scheduler = PttScheduler(
+    max_active=max(1, int(os.getenv("SCHED_MAX_ACTIVE", "16"))),
+    max_queue=max(0, int(os.getenv("SCHED_MAX_QUEUE", "32"))),
+    queue_timeout=float(os.getenv("SCHED_QUEUE_TIMEOUT", "20")),
+    dedup=SCHED_DEDUP,
+)
+
+
+def _collect():
+    s = ptt_scheduler.snapshot()
+    p = metrics.PREFIX
+    return [
+        ("gauge", f"{p}_sched_queued", {}, s["queued"]),
+        ("gauge", f"{p}_sched_active", {}, s["active"]),
+        ("gauge", f"{p}_sched_service_seconds", {}, s["service_s"]),
+    ] + [("counter", f"{p}_sched_{k}_total", {}, s[k]) for k in ("admitted", "deduped", "rejected", "timeouts")]
+
+
+metrics.registry.collectors.append(_collect)
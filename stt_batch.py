@@ -0,0 +1,90 @@
+# stt_batch.py
+# Micro-batching para Whisper: junta los audios que llegan dentro de una ventana corta
+# y los transcribe en una sola pasada (stt_local.transcribe_batch) en stt_pool.
+#
+#   STT_BATCH_MAX      audios por lote (default 8)
+#   STT_BATCH_WAIT_MS  cuánto espera el primer audio a que lleguen compañeros (default 30 ms)
+#
+# Si todos los workers de stt_pool están ocupados, los audios se siguen acumulando y el
+# siguiente lote sale más grande: a más carga, más provecho del batch.
+
+import asyncio
+import os
+
+from stt_local import transcribe_batch
+from workers import stt_pool
+
+
+class WhisperBatcher:
+    def __init__(self, pool=stt_pool, max_batch: int = 8, max_wait: float = 0.030):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = None
+        self._slots = None
+        self._task = None
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.pool.limit)
+            self._task = asyncio.create_task(self._collect())
+
+    async def transcribe(self, audio, language: str = "es") -> str:
+        self._start()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((audio, language, fut))
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            # un lote por idioma (en la práctica siempre "es")
+            by_lang = {}
+            for item in batch:
+                by_lang.setdefault(item[1], []).append(item)
+            for language, items in by_lang.items():
+                items = [it for it in items if not it[2].done()]   # el cliente pudo haberse ido
+                if not items:
+                    continue
+                try:
+                    texts = await self.pool.run(transcribe_batch, [it[0] for it in items], language)
+                except Exception as e:
+                    for _, _, fut in items:
+                        if not fut.done():
+                            fut.set_exception(e)
+                    continue
+                for (_, _, fut), text in zip(items, texts):
+                    if not fut.done():
+                        fut.set_result(text)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+stt_batcher = WhisperBatcher(
+    max_batch=max(1, int(os.getenv("STT_BATCH_MAX", "8"))),
+    max_wait=float(os.getenv("STT_BATCH_WAIT_MS", "30")) / 1000.0,
+)
@@ -0,0 +1,99 @@
+# stt_local.py
+# STT local con Whisper sobre arrays float32 16 kHz en memoria (sin archivo temporal ni ffmpeg).
+# Funciones de módulo para poder correr en stt_pool (hilos o procesos).
+
+import os
+import threading
+import time
+
+import numpy as np
+
+WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL", "base")   # "tiny" o "base" para que vaya más rápido
+
+# Un modelo por worker del pool: whisper.decode instala hooks de kv-cache en el
+# modelo mientras decodifica, así que dos hilos no pueden compartir la misma instancia.
+_local = threading.local()
+# el executor solo avisa "initializer failed": la causa queda aquí (con hilos; un proceso no la comparte)
+init_error = None
+
+
+def get_model():
+    """Carga (una vez por hilo/proceso worker) y devuelve el modelo Whisper."""
+    model = getattr(_local, "model", None)
+    if model is None:
+        import whisper
+        model = _local.model = whisper.load_model(WHISPER_MODEL_NAME)
+    return model
+
+
+def warm_up() -> float:
+    """
+    Carga el modelo de este worker y transcribe 1 s de silencio: la primera pasada es la
+    que paga inicializar kernels y memoria. Devuelve cuánto tardó esa transcripción (s).
+    """
+    get_model()
+    t0 = time.perf_counter()
+    transcribe_batch([np.zeros(16000, dtype=np.float32)], "es")
+    return time.perf_counter() - t0
+
+
+def init_worker(workers: int = 1):
+    """
+    initializer de stt_pool: el worker queda con su modelo cargado y caliente antes de su primer trabajo.
+    Cada uno usa núcleos / workers hilos de torch; por defecto torch toma todos los núcleos en cada
+    worker y N workers terminan compitiendo por ellos (más lento que uno solo).
+    """
+    global init_error
+    try:
+        import torch
+        torch.set_num_threads(max(1, (os.cpu_count() or 2) // workers))
+        _local.warm_s = warm_up()
+    except Exception as e:
+        init_error = f"{type(e).__name__}: {e}"
+        raise
+
+
+def warm_up_seconds() -> float:
+    """Lo que tardó el calentamiento de este worker (0 si no pasó por init_worker)."""
+    return getattr(_local, "warm_s", 0.0)
+
+
+def available() -> bool:
+    """Whisper (y torch) instalados; sin ellos el servidor usa solo el STT de la nube."""
+    import importlib.util
+    return all(importlib.util.find_spec(m) is not None for m in ("whisper", "torch"))
+
+
+def transcribe_batch(audios: list, language: str = "es") -> list:
+    """
+    Varios audios en una sola pasada del encoder/decoder (ventanas de 30 s apiladas).
+    Los que pasan de 30 s van por transcribe() normal, que sabe recorrer ventanas.
+    """
+    import torch
+    import whisper
+
+    model = get_model()
+    texts = [""] * len(audios)
+    short = []
+    for i, audio in enumerate(audios):
+        audio = np.asarray(audio, dtype=np.float32)
+        if len(audio) > whisper.audio.N_SAMPLES:
+            result = model.transcribe(audio, language=language)
+            texts[i] = (result.get("text") or "").strip()
+        else:
+            short.append((i, audio))
+
+    if short:
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(a)), n_mels=model.dims.n_mels)
+            for _, a in short
+        ]).to(model.device)
+        options = whisper.DecodingOptions(
+            language=language,
+            without_timestamps=True,
+            fp16=model.device.type == "cuda",
+        )
+        results = whisper.decode(model, mel, options)
+        for (i, _), r in zip(short, results):
+            texts[i] = (r.text or "").strip()
+    return texts
@@ -0,0 +1,102 @@
+# tts.py
+# TTS OpenAI -> WAV 16k/16-bit/mono, completo o en streaming
+
+import time
+
+from audio import SR_OUT, TTS_PCM_SR, StreamResampler, parse_wav, pcm16_to_wav16k, wav_header
+from cache import cache_key, normalize_text, tts_cache
+from metrics import observe_stage, record_stage
+from workers import audio_pool
+
+TTS_MODEL = "gpt-4o-mini-tts"
+TTS_VOICE = "alloy"
+TTS_CHUNK = 4096   # bytes PCM por lectura (~85 ms a 24 kHz)
+
+
+def _tts_raw_bytes(tts):
+    # según versión del SDK, puede venir como bytes, objeto con .read() o dict
+    if isinstance(tts, (bytes, bytearray)):
+        return bytes(tts)
+    read = getattr(tts, "read", None)
+    if callable(read):
+        return read()
+    if isinstance(tts, dict) and "audio" in tts:
+        return tts["audio"]
+    try:
+        return bytes(tts)
+    except Exception:
+        return None
+
+
+def tts_cache_key(text: str) -> str:
+    return cache_key("tts", TTS_MODEL, TTS_VOICE, normalize_text(text))
+
+
+async def tts_wav_bytes(client, text: str, timer=None) -> bytes:
+    """TTS completo y conversión a WAV 16k/16-bit/mono (espera todo el clip). timer: RequestTimer opcional."""
+    t0 = time.perf_counter()
+    key = tts_cache_key(text)
+    cached = await tts_cache.get(key)
+    if cached is not None:
+        record_stage(timer, "tts", time.perf_counter() - t0, "cache", TTS_MODEL)
+        return cached
+
+    # PCM crudo: se remuestrea en memoria, sin decodificar mp3 con ffmpeg
+    tts = await client.audio.speech.create(
+        model=TTS_MODEL,
+        voice=TTS_VOICE,
+        input=text,
+        response_format="pcm",
+    )
+    raw = _tts_raw_bytes(tts)
+    if not raw:
+        raise RuntimeError("No se obtuvieron bytes de TTS")
+    t1 = time.perf_counter()
+    record_stage(timer, "tts", t1 - t0, "openai", TTS_MODEL)
+
+    wav = await audio_pool.run(pcm16_to_wav16k, raw, TTS_PCM_SR)
+    record_stage(timer, "convert", time.perf_counter() - t1, "numpy")
+    tts_cache.put(key, wav)
+    return wav
+
+
+async def tts_pcm_stream(client, text: str):
+    """
+    Generador: PCM 16 kHz/16-bit/mono (sin cabecera) a medida que llega el TTS.
+    Pide PCM crudo y lo remuestrea bloque a bloque. Si el texto está en caché sale
+    de una vez sin red; si el stream termina completo, el WAV queda en tts_cache.
+    Los segmentos se solapan entre sí, así que sus tiempos van solo al histograma.
+    """
+    t0 = time.perf_counter()
+    key = tts_cache_key(text)
+    cached = await tts_cache.get(key)
+    if cached is not None:
+        observe_stage("tts_segment", time.perf_counter() - t0, "cache", TTS_MODEL)
+        yield bytes(parse_wav(cached).data)
+        return
+
+    rs = StreamResampler(TTS_PCM_SR, SR_OUT)
+    convert = 0.0
+    pcm = []
+    async with client.audio.speech.with_streaming_response.create(
+        model=TTS_MODEL,
+        voice=TTS_VOICE,
+        input=text,
+        response_format="pcm",
+    ) as resp:
+        async for chunk in resp.iter_bytes(TTS_CHUNK):
+            # bloques chicos (~85 ms): remuestrear aquí cuesta menos que saltar al pool
+            tc = time.perf_counter()
+            out = rs.feed(chunk)
+            convert += time.perf_counter() - tc
+            if out:
+                pcm.append(out)
+                yield out
+    tail = rs.flush()
+    pcm.append(tail)
+    observe_stage("tts_segment", time.perf_counter() - t0, "openai", TTS_MODEL)
+    observe_stage("convert", convert, "numpy")
+    body = b"".join(pcm)
+    tts_cache.put(key, wav_header(SR_OUT, len(body)) + body)
+    if tail:
+        yield tail
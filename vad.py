@@ -0,0 +1,148 @@
+# vad.py
+# Recorte de silencios (VAD por energía + cruces por cero) y normalización de volumen antes del STT.
+#
+# El ESP32 graba desde que se aprieta el botón hasta que se suelta: sobran silencios al
+# principio y al final, y el INMP441 llega bajito. El STT (nube o Whisper) cobra/tarda
+# según la duración, así que se manda solo la parte con voz, con pausas largas acortadas.
+#
+#   VAD=0                 desactiva la etapa (se manda el audio tal cual)
+#   VAD_MAX_PAUSE_MS      pausa interna máxima que se conserva (default 400)
+#   VAD_TARGET_DBFS       volumen RMS objetivo de la voz (default -20)
+#   VAD_ABS_FLOOR_DBFS    por debajo de esto nunca es voz, antes de cualquier ganancia (default -75)
+#
+# La decisión es por SNR: voz = frames NOISE_MARGIN_DB sobre el piso de ruido del propio clip.
+# El INMP441 llega muy bajito (el firmware se queda con 16 de sus 24 bits): una frase a -57 dBFS
+# sobre ruido a -80 es voz clara aunque esté lejos de cualquier umbral absoluto "normal".
+
+import os
+
+import numpy as np
+
+from audio import SR_OUT, wav_to_float16k
+
+VAD_ENABLED = os.getenv("VAD", "1") != "0"
+FRAME_MS = 20
+MIN_SPEECH_MS = 150          # menos que esto no es una frase (un clic del botón, un golpe)
+EDGE_PAD_MS = 120            # margen que se deja antes/después de la voz
+HANGOVER_MS = 100            # la voz se "estira" un poco para no cortar finales de sílaba
+MAX_PAUSE_MS = int(os.getenv("VAD_MAX_PAUSE_MS", "400"))
+TARGET_DBFS = float(os.getenv("VAD_TARGET_DBFS", "-20"))
+MAX_GAIN_DB = 30.0
+NOISE_MARGIN_DB = 10.0       # umbral = piso de ruido + margen
+ABS_FLOOR_DBFS = float(os.getenv("VAD_ABS_FLOOR_DBFS", "-75"))
+LOUD_DBFS = -35.0            # sobre esto siempre es voz, haya o no silencio para medir el ruido
+
+# respuesta fija cuando no hay voz: no se llama ni al STT ni al LLM (el TTS queda en caché)
+NO_SPEECH_REPLY = "No te escuché bien, PAPU. ¿Me lo repites?"
+
+# acumulados desde que arrancó el servidor (ver record)
+totals = {"requests": 0, "no_speech": 0, "seconds_in": 0.0, "seconds_out": 0.0}
+
+
+def _frames(x: np.ndarray, n: int) -> np.ndarray:
+    usable = len(x) // n * n
+    return x[:usable].reshape(-1, n)
+
+
+def _dilate(mask: np.ndarray, k: int) -> np.ndarray:
+    """Extiende cada frame con voz k frames hacia ambos lados."""
+    if k <= 0 or not mask.any():
+        return mask
+    c = np.concatenate([[0], np.cumsum(mask)])
+    idx = np.arange(len(mask))
+    lo = np.clip(idx - k, 0, len(mask))
+    hi = np.clip(idx + k + 1, 0, len(mask))
+    return (c[hi] - c[lo]) > 0
+
+
+def speech_mask(x: np.ndarray, sr: int = SR_OUT) -> np.ndarray:
+    """Un booleano por frame de FRAME_MS: True si hay voz."""
+    n = sr * FRAME_MS // 1000
+    fr = _frames(x, n)
+    if len(fr) == 0:
+        return np.zeros(0, dtype=bool)
+    rms = np.sqrt(np.mean(fr.astype(np.float64) ** 2, axis=1)) + 1e-10
+    db = 20 * np.log10(rms)
+    zcr = np.mean(np.abs(np.diff(np.signbit(fr), axis=1)), axis=1)
+
+    noise = np.percentile(db, 10)
+    thr = max(noise + NOISE_MARGIN_DB, ABS_FLOOR_DBFS)
+    # voz sonora: energía sobre el umbral; fricativas (s, f, j): algo menos de energía pero muchos cruces
+    voiced = db > thr
+    fricative = (db > thr - 6.0) & (zcr > 0.25) & (db > ABS_FLOOR_DBFS)
+    # sin silencio en el clip (vocal sostenida, botón apretado justo) el "ruido" es la propia voz:
+    # lo claramente fuerte cuenta aunque el umbral relativo quede por encima
+    loud = db > max(LOUD_DBFS, ABS_FLOOR_DBFS)
+    return _dilate(voiced | fricative | loud, HANGOVER_MS // FRAME_MS)
+
+
+def prepare_speech(x: np.ndarray, sr: int = SR_OUT):
+    """
+    float32 mono -> (audio recortado y normalizado, stats) o (None, stats) si no hay voz.
+    Pensado para correr en audio_pool.
+    """
+    seconds_in = len(x) / sr
+    stats = {"seconds_in": round(seconds_in, 3), "seconds_out": round(seconds_in, 3), "saved": 0.0}
+    if len(x) == 0:
+        # nada grabado (p.ej. un WAV de solo cabecera por un toque rápido del botón): respuesta fija
+        stats.update(speech=False)
+        return None, stats
+    if not VAD_ENABLED:
+        return x, stats
+
+    n = sr * FRAME_MS // 1000
+    mask = speech_mask(x, sr)
+    if mask.sum() * FRAME_MS < MIN_SPEECH_MS:
+        stats.update(seconds_out=0.0, saved=round(seconds_in, 3), speech=False)
+        return None, stats
+
+    # bordes: del primer al último frame con voz, más un margen
+    pad = EDGE_PAD_MS // FRAME_MS
+    idx = np.flatnonzero(mask)
+    first, last = max(0, idx[0] - pad), min(len(mask), idx[-1] + 1 + pad)
+    keep = np.zeros(len(mask), dtype=bool)
+    keep[first:last] = True
+
+    # pausas internas: de cada racha de silencio se conservan solo los primeros MAX_PAUSE_MS
+    silent = keep & ~mask
+    starts = silent & ~np.concatenate([[False], silent[:-1]])
+    if starts.any():
+        start_idx = np.flatnonzero(starts)
+        run = np.maximum(np.cumsum(starts), 1) - 1            # racha a la que pertenece cada frame
+        pos = np.arange(len(mask)) - start_idx[run]           # posición dentro de la racha
+        keep &= ~(silent & (pos >= MAX_PAUSE_MS // FRAME_MS))
+
+    fr = _frames(x, n)
+    y = fr[keep[: len(fr)]].reshape(-1)
+
+    # ganancia: voz a TARGET_DBFS de RMS, sin pasarse de MAX_GAIN_DB ni recortar picos
+    voiced = fr[mask[: len(fr)] & keep[: len(fr)]]
+    rms = float(np.sqrt(np.mean(voiced.astype(np.float64) ** 2))) + 1e-10
+    gain = min(10 ** ((TARGET_DBFS - 20 * np.log10(rms)) / 20), 10 ** (MAX_GAIN_DB / 20))
+    peak = float(np.max(np.abs(y))) if len(y) else 0.0
+    if peak * gain > 0.99:
+        gain = 0.99 / peak
+    y = (y * gain).astype(np.float32)
+
+    seconds_out = len(y) / sr
+    stats.update(seconds_out=round(seconds_out, 3), saved=round(seconds_in - seconds_out, 3),
+                 gain_db=round(float(20 * np.log10(gain)), 1), speech=True)
+    return y, stats
+
+
+def prepare_speech_wav(wav_bytes: bytes):
+    """WAV del ESP32 -> decodifica a float32 16 kHz y pasa por prepare_speech (una sola ida al pool)."""
+    return prepare_speech(wav_to_float16k(wav_bytes))
+
+
+def prepare_speech_pcm(pcm: bytes):
+    """PCM 16-bit 16 kHz (lo que junta /ws/ptt) -> prepare_speech."""
+    return prepare_speech(np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2).astype(np.float32) / 32768.0)
+
+
+def record(stats: dict):
+    """Suma las stats de un request a los acumulados (llamar desde el event loop, no desde el pool)."""
+    totals["requests"] += 1
+    totals["no_speech"] += 0 if stats.get("speech", True) else 1
+    totals["seconds_in"] += stats["seconds_in"]
+    totals["seconds_out"] += stats["seconds_out"]
@@ -0,0 +1,117 @@
+# workers.py
+# Pools acotados para trabajo CPU (Whisper, conversiones de audio) fuera del event loop.
+#
+# Variables de entorno (por pool, PREFIJO = STT_POOL / AUDIO_POOL):
+#   PREFIJO_KIND     thread | process   (default thread; torch y numpy sueltan el GIL)
+#   PREFIJO_WORKERS  hilos/procesos del pool (default: núcleos; STT la mitad, cada worker carga su Whisper)
+#   PREFIJO_LIMIT    trabajos simultáneos admitidos; el resto espera sin bloquear el loop
+#
+# Con KIND=process la función y sus argumentos deben ser picklables (funciones de módulo).
+# stt_pool usa stt_local.init_worker como initializer: cada worker carga y calienta su
+# Whisper antes de su primer trabajo (el executor solo lo crea quien usa Whisper) y deja a
+# torch con núcleos / workers hilos, para que los workers no se peleen los mismos núcleos.
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from stt_local import init_worker as whisper_init_worker
+
+CPU_COUNT = os.cpu_count() or 2
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+class CpuPool:
+    def __init__(self, name: str, kind: str = "thread", workers: int = CPU_COUNT, limit: int = CPU_COUNT,
+                 initializer=None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Pool {name}: tipo desconocido {kind!r}")
+        self.name = name
+        self.kind = kind
+        self.workers = workers
+        self.limit = limit
+        self.initializer = initializer   # initializer(workers): una vez en cada hilo/proceso al arrancar
+        self.in_flight = 0
+        self._executor = None
+        self._sem = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer,
+                                                     initargs=(self.workers,))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name,
+                                                    initializer=self.initializer, initargs=(self.workers,))
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Ejecuta fn(*args, **kwargs) en el pool respetando el límite de concurrencia."""
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.limit)
+        async with self._sem:
+            self.in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_executor(), functools.partial(fn, *args, **kwargs))
+            finally:
+                self.in_flight -= 1
+
+    async def run_each(self, fn, *args) -> list:
+        """
+        Arranca todos los workers ya (cada uno pasa por el initializer) y corre fn(*args) en cada uno.
+        Con hilos una barrera obliga a que sean hilos distintos; los procesos (fork) arrancan todos
+        juntos. No pasa por el límite de concurrencia: es para el arranque, antes de recibir trabajo.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        if self.kind == "thread":
+            barrier = threading.Barrier(self.workers)
+            call = functools.partial(_after_barrier, barrier, fn, *args)
+        else:
+            barrier, call = None, functools.partial(fn, *args)
+        jobs = [loop.run_in_executor(executor, call) for _ in range(self.workers)]
+        try:
+            return await asyncio.gather(*jobs)
+        except BaseException:
+            if barrier is not None:
+                barrier.abort()   # si un worker no arrancó, los demás no se quedan esperándolo
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _after_barrier(barrier, fn, *args):
+    barrier.wait()
+    return fn(*args)
+
+
+def _pool_from_env(prefix: str, name: str, workers: int = CPU_COUNT, initializer=None) -> CpuPool:
+    workers = _env_int(f"{prefix}_WORKERS", workers)
+    return CpuPool(
+        name,
+        kind=os.getenv(f"{prefix}_KIND", "thread"),
+        workers=workers,
+        limit=_env_int(f"{prefix}_LIMIT", workers),
+        initializer=initializer,
+    )
+
+
+stt_pool = _pool_from_env("STT_POOL", "stt", workers=max(1, CPU_COUNT // 2), initializer=whisper_init_worker)
+audio_pool = _pool_from_env("AUDIO_POOL", "audio")
+
+
+def shutdown_pools():
+    stt_pool.shutdown()
+    audio_pool.shutdown()
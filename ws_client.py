@@ -0,0 +1,96 @@
+# ws_client.py
+# Cliente de referencia para /ws/ptt: hace de ESP32 reproduciendo un WAV en tiempo real.
+#
+#   python ws_client.py --url ws://localhost:8000/ws/ptt --wav test.wav --out reply.wav
+#
+# Manda los frames al ritmo del micrófono (1024 muestras, como rec_append del firmware),
+# suelta el "botón" y mide cuánto tarda en llegar el primer audio de la respuesta.
+# Con --repeat N hace N pulsaciones sobre la misma conexión; --codec/--rate piden un formato
+# comprimido para la respuesta (reply_format.py).
+
+import argparse
+import asyncio
+import json
+import time
+
+import websockets
+
+from audio import SR_OUT, float_to_pcm16, wav_to_float16k
+from reply_format import DEFAULT_FORMAT, ReplyFormat, decode_wav
+
+FRAME_SAMPLES = 1024   # igual que CHUNK_SAMPLES en paputeadoro.ino
+
+
+async def press(ws, pcm: bytes, realtime: bool = True):
+    """Una pulsación: start, frames, end; devuelve (formato, audio de la respuesta sin cabecera)."""
+    frame_bytes = FRAME_SAMPLES * 2
+    await ws.send(json.dumps({"type": "start", "sample_rate": SR_OUT}))
+    t_start = time.perf_counter()
+    for i, off in enumerate(range(0, len(pcm), frame_bytes)):
+        await ws.send(pcm[off:off + frame_bytes])
+        if realtime:
+            # duerme hasta el instante en que el micrófono habría entregado el siguiente frame
+            due = t_start + (i + 1) * FRAME_SAMPLES / SR_OUT
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+    await ws.send(json.dumps({"type": "end"}))
+    t_end = time.perf_counter()
+
+    reply = bytearray()
+    fmt = DEFAULT_FORMAT
+    t_first = None
+    while True:
+        msg = await ws.recv()
+        if isinstance(msg, bytes):
+            if t_first is None:
+                t_first = time.perf_counter()
+            reply += msg
+            continue
+        ctrl = json.loads(msg)
+        if ctrl.get("type") == "stt":
+            print(f"[ws] STT: {ctrl.get('text')!r}  ({(time.perf_counter() - t_end) * 1000:.0f} ms)")
+        elif ctrl.get("type") == "reply":
+            fmt = ReplyFormat(ctrl.get("codec", "pcm"), int(ctrl.get("sample_rate", SR_OUT)))
+        elif ctrl.get("type") == "error":
+            print(f"[ws] ERROR: {ctrl.get('msg')}")
+            return fmt, bytes(reply)
+        elif ctrl.get("type") == "done":
+            break
+
+    t_done = time.perf_counter()
+    first_ms = (t_first - t_end) * 1000 if t_first else float("nan")
+    samples, sr = decode_wav(fmt.header(len(reply)) + reply)
+    print(f"[ws] primer audio {first_ms:.0f} ms tras soltar, fin {(t_done - t_end) * 1000:.0f} ms, "
+          f"{len(reply)} bytes {fmt.name} ({len(samples) / sr:.2f} s)")
+    return fmt, bytes(reply)
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="ws://localhost:8000/ws/ptt")
+    ap.add_argument("--device", default="ws-client")
+    ap.add_argument("--wav", default="test.wav")
+    ap.add_argument("--out", default=None, help="guarda la última respuesta como WAV")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--fast", action="store_true", help="sube sin esperar el tiempo real")
+    ap.add_argument("--codec", default="pcm", help="formato de la respuesta: pcm, ulaw o adpcm")
+    ap.add_argument("--rate", type=int, default=SR_OUT, help="frecuencia de la respuesta: 16000 u 8000")
+    args = ap.parse_args()
+
+    with open(args.wav, "rb") as f:
+        pcm = float_to_pcm16(wav_to_float16k(f.read()))
+    print(f"[ws] {args.wav}: {len(pcm) / 2 / SR_OUT:.2f} s a 16 kHz")
+
+    url = f"{args.url}?device={args.device}&codec={args.codec}&rate={args.rate}"
+    async with websockets.connect(url, max_size=None) as ws:
+        fmt, reply = DEFAULT_FORMAT, b""
+        for _ in range(args.repeat):
+            fmt, reply = await press(ws, pcm, realtime=not args.fast)
+
+    if args.out:
+        with open(args.out, "wb") as f:
+            f.write(fmt.header(len(reply)) + reply)
+        print(f"[ws] respuesta guardada en {args.out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
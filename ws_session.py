@@ -0,0 +1,153 @@
+# ws_session.py
+# Sesión WebSocket por dispositivo: una conexión abierta, muchas pulsaciones.
+#
+# Protocolo (mensajes de texto son JSON, binarios son PCM 16-bit LE mono):
+#   cliente  -> {"type": "start", "sample_rate": 16000}   botón presionado (8000-48000 Hz)
+#   cliente  -> binario                                   frames del micrófono mientras se mantiene
+#   cliente  -> {"type": "end"}                           botón soltado
+#   servidor -> {"type": "stt", "text": "..."}
+#   servidor -> {"type": "reply", "codec": "pcm", "sample_rate": 16000, "block_align": 2}
+#   servidor -> binario                                   audio de la respuesta, en bloques enteros
+#   servidor -> {"type": "done", "ms": ..., "timing": "stt;dur=..."}  o  {"type": "error", "msg": "..."}
+#
+# Los frames se van convirtiendo a 16 kHz mientras llegan, así al soltar el botón
+# el audio ya está listo para STT (sin SD, sin re-subir el archivo, sin parsear WAV).
+# El formato de la respuesta se elige al conectar: /ws/ptt?codec=adpcm&rate=8000 (reply_format.py).
+
+import json
+import time
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from audio import SR_OUT, StreamResampler
+from metrics import RequestTimer, count_bytes
+from reply_format import ReplyFormat, negotiate
+
+# sample_rate aceptado en "start"; fuera de esto el filtro del remuestreo crece sin sentido
+MIN_SAMPLE_RATE, MAX_SAMPLE_RATE = 8000, 48000
+
+
+def parse_sample_rate(value) -> int:
+    """sample_rate del mensaje "start" -> entero en rango; ValueError si no sirve."""
+    try:
+        rate = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"sample_rate inválido: {value!r}") from None
+    if not MIN_SAMPLE_RATE <= rate <= MAX_SAMPLE_RATE:
+        raise ValueError(f"sample_rate fuera de rango: {rate} ({MIN_SAMPLE_RATE}-{MAX_SAMPLE_RATE})")
+    return rate
+
+
+class Utterance:
+    def __init__(self, sample_rate: int = SR_OUT):
+        self._rs = StreamResampler(sample_rate, SR_OUT) if sample_rate != SR_OUT else None
+        self._odd = b""
+        self.pcm = bytearray()
+        self.rx_bytes = 0
+
+    def feed(self, data: bytes):
+        self.rx_bytes += len(data)
+        if self._rs is not None:
+            self.pcm += self._rs.feed(data)
+            return
+        data = self._odd + data
+        cut = len(data) - (len(data) % 2)
+        self._odd = data[cut:]
+        self.pcm += data[:cut]
+
+    def finish(self) -> bytes:
+        if self._rs is not None:
+            self.pcm += self._rs.flush()
+        return bytes(self.pcm)
+
+
+async def run_ws_session(ws: WebSocket, transcribe, reply_stream):
+    """
+    transcribe(pcm16k: bytes, timer) -> str, o None si no hubo voz (VAD)
+    reply_stream(user_text, header=False, timer=timer, fmt=fmt) -> (primer_bloque, iterador de audio);
+        con None, respuesta fija
+    Cada pulsación es un request "ws" en /metrics (timer = metrics.RequestTimer).
+    """
+    await ws.accept()
+    device = ws.query_params.get("device", ws.client.host if ws.client else "?")
+    try:
+        fmt = negotiate(ws.query_params, ws.headers.get("accept"))
+    except ValueError as e:
+        await ws.send_json({"type": "error", "msg": f"Formato de respuesta: {e}"})
+        await ws.close(code=1003)
+        return
+    print(f"[ws] {device} conectado ({fmt.name})")
+    utt = None
+    try:
+        while True:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+
+            if msg.get("bytes") is not None:
+                if utt is None:
+                    utt = Utterance()   # frames sin "start": se asume 16 kHz
+                utt.feed(msg["bytes"])
+                continue
+
+            try:
+                ctrl = json.loads(msg.get("text") or "{}")
+            except ValueError:
+                await ws.send_json({"type": "error", "msg": "mensaje no es JSON"})
+                continue
+
+            kind = ctrl.get("type")
+            if kind == "start":
+                try:
+                    utt = Utterance(parse_sample_rate(ctrl.get("sample_rate", SR_OUT)))
+                except ValueError as e:
+                    utt = None
+                    await ws.send_json({"type": "error", "msg": str(e)})
+            elif kind == "end":
+                if utt is None:
+                    await ws.send_json({"type": "error", "msg": "end sin audio"})
+                    continue
+                rx, pcm, utt = utt.rx_bytes, utt.finish(), None
+                count_bytes("rx", rx)
+                timer, ok = RequestTimer("ws"), False
+                try:
+                    ok = await _reply(ws, device, pcm, transcribe, reply_stream, timer, fmt)
+                finally:
+                    timer.finish(200 if ok else 500)
+            elif kind == "ping":
+                await ws.send_json({"type": "pong"})
+    except WebSocketDisconnect:
+        pass
+    print(f"[ws] {device} desconectado")
+
+
+async def _reply(ws: WebSocket, device: str, pcm: bytes, transcribe, reply_stream, timer: RequestTimer,
+                 fmt: ReplyFormat) -> bool:
+    t0 = time.time()
+    print(f"[ws] {device} RX {len(pcm)} bytes PCM")
+    try:
+        user_text = await transcribe(pcm, timer)
+    except Exception as e:
+        print(f"[ws] {device} Error STT: {e}")
+        await ws.send_json({"type": "error", "msg": f"Error STT: {e}"})
+        return False
+    await ws.send_json({"type": "stt", "text": user_text or ""})
+
+    try:
+        first, stream = await reply_stream(user_text, header=False, timer=timer, fmt=fmt)
+    except Exception as e:
+        print(f"[ws] {device} Error LLM/TTS: {e}")
+        await ws.send_json({"type": "error", "msg": f"Error LLM/TTS: {e}"})
+        return False
+
+    await ws.send_json({"type": "reply", "codec": fmt.codec, "sample_rate": fmt.rate, "block_align": fmt.block_align})
+    sent = 0
+    async for chunk in stream:
+        if chunk:
+            await ws.send_bytes(chunk)
+            sent += len(chunk)
+    count_bytes("tx", sent)
+    ms = int((time.time() - t0) * 1000)
+    print(f"[ws] {device} TX {sent} bytes {fmt.name} en {ms} ms")
+    await ws.send_json({"type": "done", "ms": ms, "timing": timer.server_timing()})
+    return True